@@ -0,0 +1,168 @@
+"""Benchmark hors-ligne de bot2: le pipeline complet de main() tourne contre le serveur XRPC
+local (bench/fake_xrpc.py), délais anti-spam coupés.
+
+Pour chaque taille de pool de candidats: latence par étape, appels API par endpoint,
+octets servis et pic mémoire (tracemalloc). Le rapport est aussi écrit dans bench_output.txt.
+
+    python bench/bench_bot2.py --pools 40,400,4000 --repeat 3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+
+from fake_xrpc import ME_HANDLE, FakeXrpcServer, Fixtures, load_seed_texts  # noqa: E402
+
+STAGES = [
+    "login",
+    "load_state",
+    "engage_opt_in",
+    "maybe_original_post",
+    "discovery_likes_and_maybe_reposts",
+    "repost_from_sources_with_quotes",
+    "save_state",
+]
+
+
+def _bench_env(server_url: str, sources: List[str]) -> None:
+    """Config du bot pour le bench; les variables déjà définies par l'appelant sont respectées."""
+    defaults = {
+        "BSKY2_HANDLE": ME_HANDLE,
+        "BSKY2_APP_PASSWORD": "bench",
+        "BOT2_PDS_URL": server_url,
+        "BOT2_DELAY_MIN_S": "0",
+        "BOT2_DELAY_MAX_S": "0",
+        "BOT2_WRITES_PER_MIN": "0",
+        "BOT2_DISCOVERY_WEIGHT": "1",
+        "BOT2_ORIGINAL_POST_WEIGHT": "1",
+        "BOT2_MAX_ENG_PER_RUN": "3",
+        "BOT2_LIKE_LIMIT": "3",
+        "BOT2_REPOST_LIMIT": "4",
+        "BOT2_SOURCE_HANDLES": ",".join(sources),
+        "BOT2_QUOTE_HANDLE": "quote.bench.test",
+        "BOT2_DAILY_PLAN": "0",  # caps par run fixes: le plan du jour dépend de l'heure du bench, voir check_plan.py
+    }
+    for k, v in defaults.items():
+        os.environ.setdefault(k, v)
+
+
+def run_once(bot2: Any, server: FakeXrpcServer, verbose: bool) -> Dict[str, Any]:
+    timings: Dict[str, float] = defaultdict(float)
+    originals = {name: getattr(bot2, name) for name in STAGES}
+
+    def timed(name: str, fn: Any) -> Any:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - t0
+        return wrapper
+
+    for name, fn in originals.items():
+        setattr(bot2, name, timed(name, fn))
+    server.calls.clear()
+    server.bytes_out.clear()
+    out = io.StringIO()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else out):
+            bot2.main(ignore_window=True)
+    finally:
+        total = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        for name, fn in originals.items():
+            setattr(bot2, name, fn)
+    return {
+        "total_s": total,
+        "stages_s": dict(timings),
+        "calls": dict(server.calls),
+        "bytes": sum(server.bytes_out.values()),
+        "peak_mb": peak / 1e6,
+    }
+
+
+def _format(pool: int, runs: List[Dict[str, Any]]) -> str:
+    med = lambda xs: statistics.median(xs) if xs else 0.0  # noqa: E731
+    lines = [f"== pool={pool} runs={len(runs)}"]
+    lines.append(f"  total            {med([r['total_s'] for r in runs]) * 1000:9.1f} ms")
+    for name in STAGES:
+        lines.append(f"  {name:<34}{med([r['stages_s'].get(name, 0.0) for r in runs]) * 1000:9.1f} ms")
+    calls = runs[-1]["calls"]
+    lines.append(f"  api calls        {sum(calls.values())} ({', '.join(f'{k}={v}' for k, v in sorted(calls.items()))})")
+    lines.append(f"  bytes received   {runs[-1]['bytes']}")
+    lines.append(f"  peak memory      {max(r['peak_mb'] for r in runs):.2f} MB")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Offline end-to-end benchmark of bot2")
+    ap.add_argument("--pools", default="40,400,4000", help="tailles de pool de candidats, séparées par des virgules")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--warmup", type=int, default=1, help="runs non comptés (imports, modèles SDK)")
+    ap.add_argument("--sources", type=int, default=5)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latence simulée par requête")
+    ap.add_argument("--seed-text", help="JSONL dont les champs body/text servent de textes de posts (ex. requests.jsonl)")
+    ap.add_argument("--json", help="écrire aussi les résultats bruts dans ce fichier")
+    ap.add_argument("--output", default=os.path.join(ROOT, "bench_output.txt"))
+    ap.add_argument("--verbose", action="store_true", help="afficher la sortie du bot")
+    args = ap.parse_args()
+
+    texts = load_seed_texts(args.seed_text) if args.seed_text else None
+    pools = [int(x) for x in args.pools.split(",") if x.strip()]
+    server = FakeXrpcServer(Fixtures(pool=pools[0], sources=args.sources, texts=texts),
+                            latency_s=args.latency_ms / 1000).start()
+    _bench_env(server.url, server.fixtures.source_handles)
+    import bot2  # après l'env: la config du bot est lue à l'import
+
+    results: Dict[int, List[Dict[str, Any]]] = {}
+    report = []
+    cwd = os.getcwd()
+    try:
+        for pool in pools:
+            server.fixtures = Fixtures(pool=pool, sources=args.sources, texts=texts)
+            # Recherche profonde: le pool est couvert par des pages de 100 (max de l'API), une query
+            # "shard N" par page, fusionnées par le mode fan-out.
+            bot2.DISCOVERY_SEARCH_LIMIT = min(pool, 100)
+            bot2.DISCOVERY_MODE = "fanout"
+            bot2.QUERIES_ENV = [f"shard {i}" for i in range((pool + 99) // 100)]
+            runs = []
+            for i in range(args.warmup + args.repeat):
+                with tempfile.TemporaryDirectory() as tmp:
+                    os.chdir(tmp)  # state, journal et session isolés par run
+                    try:
+                        result = run_once(bot2, server, args.verbose)
+                        if i >= args.warmup:
+                            runs.append(result)
+                    finally:
+                        os.chdir(cwd)
+            results[pool] = runs
+            report.append(_format(pool, runs))
+            print(report[-1])
+    finally:
+        server.stop()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("\n".join(report) + "\n")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
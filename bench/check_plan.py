@@ -0,0 +1,144 @@
+"""Vérification hors-ligne du budget quotidien de bot2 (plan_run, _plan_globals, journal "act").
+
+Simule une soirée à heures figées (BOT2_DAEMON_RUNS=5, soit un run par heure de 18:00 à 23:00):
+chaque run fait exactement son quota, un run est manqué, le process "redémarre" avant le dernier
+run (state relu depuis le journal seul) et la journée suivante repart de zéro. Les budgets sont
+des multiples du nombre de runs: aucune part fractionnaire, donc aucun tirage au sort. Les caps
+par run laissent passer le rattrapage (2x la part égale), sauf dans le cas qui vérifie le plafond.
+
+    python bench/check_plan.py
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import datetime as dt
+from typing import Any, Dict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+BUDGET = {"likes": 10, "reposts": 10, "quotes": 5, "replies": 15, "posts": 5}
+# Caps par run: 2x la part égale (quotes: 4 x 0.5)
+CAPS = {"BOT2_LIKE_LIMIT": 4, "BOT2_REPOST_LIMIT": 4, "BOT2_QUOTE_SHARE": 0.5, "BOT2_MAX_ENG_PER_RUN": 6,
+        "BOT2_MAX_POSTS_PER_RUN": 2}
+
+
+def _plan_env() -> None:
+    os.environ.update({
+        "BOT2_DAEMON_RUNS": "5",
+        "BOT2_PLAN_CATCHUP": "2",
+        "BOT2_METRICS_DIR": "",
+        **{k: str(v) for k, v in CAPS.items()},
+        **{f"BOT2_DAILY_{kind.upper()}": str(n) for kind, n in BUDGET.items()},
+    })
+
+
+def _at(bot2: Any, day: dt.date, hour: int, minute: int = 30) -> dt.datetime:
+    return dt.datetime.combine(day, dt.time(hour, minute), bot2.ZoneInfo(bot2.TIMEZONE))
+
+
+def _done(state: Dict[str, Any]) -> Dict[str, int]:
+    done = state.get("daily_actions", {}).get("done", {})
+    return {kind: len(done.get(kind, [])) for kind in BUDGET}
+
+
+def _run(bot2: Any, state: Dict[str, Any], now: dt.datetime) -> Dict[str, int]:
+    """Un run simulé: plan à l'heure `now`, puis exactement les actions que ses réglages permettent
+    (un quote compte aussi comme repost, comme dans _after_repost)."""
+    bot2._FROZEN_NOW = now  # _count_action date les actions avec la même horloge
+    with contextlib.redirect_stdout(io.StringIO()):
+        quota = bot2.plan_run(state, now)
+        g = bot2._plan_globals(quota)
+        reposts = g["MAX_REPOSTS_PER_RUN"]
+        quotes = int(round(reposts * g["QUOTE_SHARE"]))
+        assert quotes <= reposts, (quotes, reposts)
+        tag = now.strftime("%Y%m%d%H%M")
+        for i in range(g["DISCOVERY_LIKE_LIMIT"]):
+            bot2._count_action(state, "likes", f"like-{tag}-{i}")
+        for i in range(reposts):
+            bot2._count_action(state, "reposts", f"repost-{tag}-{i}")
+            if i < quotes:
+                bot2._count_action(state, "quotes", f"repost-{tag}-{i}")
+        for i in range(g["MAX_ENGAGEMENTS_PER_RUN"]):
+            bot2._count_action(state, "replies", f"reply-{tag}-{i}")
+        for i in range(g["MAX_ORIGINAL_POSTS_PER_RUN"] if g["DO_ORIGINAL_POST_WEIGHT"] else 0):
+            bot2._count_action(state, "posts", f"post-{tag}-{i}")
+    return quota
+
+
+def check(bot2: Any) -> None:
+    day = dt.date(2026, 3, 10)
+
+    # Runs restants dans la fenêtre (celui-ci compris)
+    for hour, minute, left in [(12, 0, 5), (18, 0, 5), (18, 30, 5), (19, 30, 4), (20, 30, 3), (22, 30, 1), (22, 59, 1)]:
+        got = bot2._runs_left(_at(bot2, day, hour, minute))
+        assert got == left, f"_runs_left({hour}:{minute:02d}) = {got}, expected {left}"
+
+    state = bot2.load_state()
+    expected = [
+        # (heure, quota attendu)
+        (18, {"likes": 2, "reposts": 2, "quotes": 1, "replies": 3, "posts": 1}),
+        (19, {"likes": 2, "reposts": 2, "quotes": 1, "replies": 3, "posts": 1}),
+        (20, {"likes": 2, "reposts": 2, "quotes": 1, "replies": 3, "posts": 1}),
+        # 21:30 manqué
+    ]
+    for hour, want in expected:
+        quota = _run(bot2, state, _at(bot2, day, hour))
+        assert quota == want, f"{hour}:30 quota {quota}, expected {want}"
+    assert _done(state) == {"likes": 6, "reposts": 6, "quotes": 3, "replies": 9, "posts": 3}, _done(state)
+
+    # Redémarrage: aucun snapshot écrit, le compte du jour vient du seul journal; le rejouer une
+    # seconde fois ne compte rien en double
+    state = bot2.load_state()
+    assert _done(state) == {"likes": 6, "reposts": 6, "quotes": 3, "replies": 9, "posts": 3}, _done(state)
+    bot2._replay_journal(state)
+    assert _done(state) == {"likes": 6, "reposts": 6, "quotes": 3, "replies": 9, "posts": 3}, _done(state)
+
+    # Dernier run: rattrape le run manqué, dans la limite de PLAN_CATCHUP x la part égale
+    quota = _run(bot2, state, _at(bot2, day, 22))
+    want = {"likes": 4, "reposts": 4, "quotes": 2, "replies": 6, "posts": 2}
+    assert quota == want, f"22:30 quota {quota}, expected {want}"
+    assert _done(state) == BUDGET, f"day total {_done(state)}, expected {BUDGET}"
+
+    # Budget épuisé: plus rien ce soir
+    quota = _run(bot2, state, _at(bot2, day, 22, 50))
+    assert not any(quota.values()), quota
+
+    # Jour suivant, premier run à 22:30: tout le budget reste, mais le rattrapage est plafonné, et
+    # jamais au-delà des caps par run configurés
+    next_day = _at(bot2, day + dt.timedelta(days=1), 22)
+    low = {"DISCOVERY_LIKE_LIMIT": 3, "MAX_REPOSTS_PER_RUN": 2, "MAX_ENGAGEMENTS_PER_RUN": 3,
+           "MAX_ORIGINAL_POSTS_PER_RUN": 1}
+    with bot2._globals_override(low), contextlib.redirect_stdout(io.StringIO()):
+        quota = bot2.plan_run(state, next_day)
+    want = {"likes": 3, "reposts": 2, "quotes": 1, "replies": 3, "posts": 1}
+    assert quota == want, f"next day 22:30 quota under low caps {quota}, expected {want}"
+    quota = _run(bot2, state, next_day)
+    want = {"likes": 4, "reposts": 4, "quotes": 2, "replies": 6, "posts": 2}
+    assert quota == want, f"next day 22:30 quota {quota}, expected {want}"
+
+    # Plus de reposts au budget mais des quotes restants: aucun repost déguisé en quote
+    g = bot2._plan_globals({"likes": 0, "reposts": 0, "quotes": 2, "replies": 0, "posts": 0})
+    assert g["MAX_REPOSTS_PER_RUN"] == 0 and g["QUOTE_SHARE"] == 0.0, g
+    g = bot2._plan_globals({"likes": 0, "reposts": 1, "quotes": 2, "replies": 0, "posts": 0})
+    assert g["MAX_REPOSTS_PER_RUN"] == 1 and int(round(g["QUOTE_SHARE"])) == 1, g
+
+
+def main() -> None:
+    _plan_env()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # state et journal isolés
+        try:
+            import bot2  # après l'env: la config du bot est lue à l'import
+            check(bot2)
+        finally:
+            os.chdir(cwd)
+    print("daily plan check: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Serveur Jetstream local (stand-in websocket) pour tester le mode stream de bot2.
+
+Rejoue des événements enregistrés (JSONL, une ligne par message Jetstream) ou synthétiques, en
+respectant les paramètres de /subscribe: cursor (time_us), wantedCollections et wantedDids.
+--drop-after coupe chaque connexion après N messages (test de la reprise au cursor).
+
+    python bench/fake_jetstream.py --port 8766 --synthetic 2000 --rate 200
+    python bench/fake_jetstream.py --record wss://jetstream2.us-east.bsky.network/subscribe --out events.jsonl
+    BOT2_STREAM_URL=ws://127.0.0.1:8766/subscribe python bot2.py --daemon
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+from websockets.sync.server import serve
+
+from fake_xrpc import ARTICLE_URLS, MARKET_URLS, SYNTHETIC_TEXTS, did_for
+
+POST = "app.bsky.feed.post"
+
+
+def synthetic_events(n: int, sources: Optional[List[str]] = None, seed: int = 1,
+                     texts: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """n messages Jetstream déterministes: surtout des créations de posts (images, liens,
+    réponses, 10% venant de `sources`), plus des likes, suppressions et événements identity."""
+    rng = random.Random(seed)
+    texts = texts or SYNTHETIC_TEXTS
+    sources = sources or []
+    t0 = int((time.time() - n * 0.05) * 1e6)
+    events = []
+    for i in range(n):
+        t = t0 + i * 50_000
+        handle = rng.choice(sources) if sources and rng.random() < 0.1 else f"fire{rng.randrange(500)}.bench.test"
+        did = did_for(handle)
+        roll = rng.random()
+        if roll < 0.05:
+            events.append({"did": did, "time_us": t, "kind": "identity",
+                           "identity": {"did": did, "handle": handle, "seq": i, "time": ""}})
+            continue
+        if roll < 0.15:
+            events.append({"did": did, "time_us": t, "kind": "commit",
+                           "commit": {"rev": f"r{i}", "operation": "create", "collection": "app.bsky.feed.like",
+                                      "rkey": f"l{i:07d}", "record": {"$type": "app.bsky.feed.like"},
+                                      "cid": f"bafyreilike{i:07d}"}})
+            continue
+        if roll < 0.2:
+            events.append({"did": did, "time_us": t, "kind": "commit",
+                           "commit": {"rev": f"r{i}", "operation": "delete", "collection": POST,
+                                      "rkey": f"s{i:07d}"}})
+            continue
+        record: Dict[str, Any] = {"$type": POST, "text": rng.choice(texts), "langs": ["en"],
+                                  "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(t / 1e6))}
+        media = rng.random()
+        if media < 0.5:
+            record["embed"] = {"$type": "app.bsky.embed.images",
+                               "images": [{"alt": "", "image": {"$type": "blob", "mimeType": "image/jpeg", "size": 1}}]}
+        elif media < 0.7:
+            record["embed"] = {"$type": "app.bsky.embed.external",
+                               "external": {"uri": rng.choice(MARKET_URLS + ARTICLE_URLS), "title": "", "description": ""}}
+        if rng.random() < 0.15:
+            ref = {"uri": f"at://{did}/{POST}/s{i:07d}", "cid": f"bafyreipost{i:07d}"}
+            record["reply"] = {"root": ref, "parent": ref}
+        events.append({"did": did, "time_us": t, "kind": "commit",
+                       "commit": {"rev": f"r{i}", "operation": "create", "collection": POST,
+                                  "rkey": f"s{i:07d}", "record": record, "cid": f"bafyreipost{i:07d}"}})
+    return events
+
+
+def load_events(path: str) -> List[Dict[str, Any]]:
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    events.sort(key=lambda e: e.get("time_us", 0))
+    return events
+
+
+def record_events(url: str, path: str, count: int) -> None:
+    """Enregistre `count` messages d'un vrai Jetstream (posts seulement) dans `path`."""
+    sep = "&" if "?" in url else "?"
+    with connect(f"{url}{sep}wantedCollections={POST}") as ws, open(path, "w", encoding="utf-8") as f:
+        for _ in range(count):
+            f.write(ws.recv() + "\n")
+
+
+def _wanted(evt: Dict[str, Any], cursor: int, collections: set, dids: set) -> bool:
+    if evt.get("time_us", 0) < cursor:
+        return False
+    if dids and evt.get("did") not in dids:
+        return False
+    if collections and evt.get("kind") == "commit":
+        return (evt.get("commit") or {}).get("collection") in collections
+    return True
+
+
+class FakeJetstreamServer:
+    """Serveur dans un thread. connections: (cursor demandé, messages envoyés) par connexion."""
+
+    def __init__(self, events: List[Dict[str, Any]], port: int = 0, rate: float = 0.0,
+                 drop_after: int = 0):
+        self.events = events
+        self.rate = rate  # messages/s par connexion (0 = au plus vite)
+        self.drop_after = drop_after
+        self.connections: List[List[int]] = []
+        self._lock = threading.Lock()
+        self.server = serve(self._handler, "127.0.0.1", port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.socket.getsockname()[:2]
+        return f"ws://{host}:{port}/subscribe"
+
+    def start(self) -> "FakeJetstreamServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def _handler(self, ws: Any) -> None:
+        params = parse_qs(urlparse(ws.request.path).query)
+        cursor = int((params.get("cursor") or ["0"])[0] or 0)
+        collections = set(params.get("wantedCollections", []))
+        dids = set(params.get("wantedDids", []))
+        conn = [cursor, 0]
+        with self._lock:
+            self.connections.append(conn)
+        try:
+            for evt in self.events:
+                if not _wanted(evt, cursor, collections, dids):
+                    continue
+                ws.send(json.dumps(evt))
+                conn[1] += 1
+                if self.drop_after and conn[1] >= self.drop_after:
+                    ws.close()
+                    return
+                if self.rate:
+                    time.sleep(1 / self.rate)
+            for _ in ws:  # flux à jour: on garde la connexion ouverte, comme le vrai serveur
+                pass
+        except ConnectionClosed:
+            pass
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--events", help="JSONL d'événements Jetstream enregistrés")
+    ap.add_argument("--synthetic", type=int, default=1000, help="nombre d'événements synthétiques (sans --events)")
+    ap.add_argument("--sources", default="", help="handles des sources, séparés par des virgules")
+    ap.add_argument("--rate", type=float, default=0.0, help="messages/s par connexion")
+    ap.add_argument("--drop-after", type=int, default=0)
+    ap.add_argument("--record", metavar="URL", help="enregistrer depuis un vrai Jetstream au lieu de servir")
+    ap.add_argument("--out", default="jetstream_events.jsonl")
+    ap.add_argument("--count", type=int, default=1000)
+    args = ap.parse_args()
+    if args.record:
+        record_events(args.record, args.out, args.count)
+        print(f"{args.count} events written to {args.out}")
+    else:
+        sources = [h.strip() for h in args.sources.split(",") if h.strip()]
+        events = load_events(args.events) if args.events else synthetic_events(args.synthetic, sources)
+        srv = FakeJetstreamServer(events, port=args.port, rate=args.rate, drop_after=args.drop_after)
+        print(f"Fake Jetstream on {srv.url} ({len(events)} events, Ctrl-C to stop)")
+        try:
+            srv.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,271 @@
+"""Serveur XRPC local (stand-in de Bluesky) pour les benchmarks de bot2.
+
+Sert searchPosts, getAuthorFeed, listNotifications, getProfile, resolveHandle, les sessions et
+les écritures (createRecord, applyWrites, updateSeen) à partir de fixtures synthétiques, ou d'un
+fichier JSON enregistré {nsid: réponse}. Compte les appels et les octets servis par endpoint.
+
+    python bench/fake_xrpc.py --port 8765 --pool 400
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+ME_HANDLE = "bench.bot2.test"
+ME_DID = "did:plc:benchbot2"
+
+SYNTHETIC_TEXTS = [
+    "New 1/1 drop on foundation ✨ #nftart",
+    "Generative piece, minted on fxhash today #genart",
+    "Thread: my analysis of the NFT market report",
+    "Sunday sketch, nothing to sell, just colors",
+    "Cryptoart WIP, tezos mint soon",
+    "Read my new article on substack about digital art",
+    "Opening a new collection on opensea 🎨",
+]
+MARKET_URLS = ["https://opensea.io/collection/x", "https://foundation.app/@x", "https://objkt.com/x"]
+ARTICLE_URLS = ["https://medium.com/@x/post", "https://x.substack.com/p/y", "https://news.example/z"]
+
+
+def _jwt(exp: int) -> str:
+    def b64(d: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(d).encode()).rstrip(b"=").decode()
+
+    return f"{b64({'alg': 'HS256', 'typ': 'JWT'})}.{b64({'sub': ME_DID, 'exp': exp, 'scope': 'com.atproto.access'})}.c2ln"
+
+
+def did_for(handle: str) -> str:
+    """DID synthétique d'un handle de fixture (même valeur pour resolveHandle et les posts)."""
+    return "did:plc:" + handle.split(".")[0].ljust(8, "x")
+
+
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(ts))
+
+
+class Fixtures:
+    """Données synthétiques déterministes (seed) pour un pool de `pool` posts de recherche."""
+
+    def __init__(self, pool: int = 40, sources: int = 5, notifications: int = 10, seed: int = 1,
+                 texts: Optional[List[str]] = None):
+        rng = random.Random(seed)
+        self.texts = texts or SYNTHETIC_TEXTS
+        now = time.time()
+        self.search = [self._post(rng, i, f"u{i % max(1, pool // 3)}.bench.test", now - i * 60) for i in range(pool)]
+        self.source_handles = [f"src{i}.bench.test" for i in range(sources)]
+        self.feeds = {
+            h: [{"post": self._post(rng, 10_000 + j * 100 + k, h, now - k * 600)} for k in range(10)]
+            for j, h in enumerate(self.source_handles + ["quote.bench.test"])
+        }
+        self.notifications = [self._notification(rng, i, now - i * 120) for i in range(notifications)]
+
+    def _post(self, rng: random.Random, i: int, handle: str, ts: float) -> Dict[str, Any]:
+        did = did_for(handle)
+        post: Dict[str, Any] = {
+            "uri": f"at://{did}/app.bsky.feed.post/p{i:06d}",
+            "cid": f"bafyreibench{i:06d}",
+            "author": {"did": did, "handle": handle},
+            "record": {"$type": "app.bsky.feed.post", "text": rng.choice(self.texts), "createdAt": _iso(ts)},
+            "indexedAt": _iso(ts),
+        }
+        roll = rng.random()
+        if roll < 0.6:
+            post["embed"] = {
+                "$type": "app.bsky.embed.images#view",
+                "images": [{"thumb": "https://cdn.test/t.jpg", "fullsize": "https://cdn.test/f.jpg", "alt": ""}],
+            }
+        elif roll < 0.8:
+            url = rng.choice(MARKET_URLS + ARTICLE_URLS)
+            post["embed"] = {
+                "$type": "app.bsky.embed.external#view",
+                "external": {"uri": url, "title": "link", "description": ""},
+            }
+        if rng.random() < 0.15:
+            ref = {"uri": post["uri"], "cid": post["cid"]}
+            post["record"]["reply"] = {"root": ref, "parent": ref}
+        return post
+
+    def _notification(self, rng: random.Random, i: int, ts: float) -> Dict[str, Any]:
+        post = self._post(rng, 50_000 + i, f"fan{i}.bench.test", ts)
+        return {
+            "uri": post["uri"],
+            "cid": post["cid"],
+            "author": post["author"],
+            "reason": rng.choice(["mention", "reply", "like", "follow"]),
+            "record": post["record"],
+            "isRead": False,
+            "indexedAt": post["indexedAt"],
+        }
+
+
+def _page(items: List[Any], params: Dict[str, str], default_limit: int = 50):
+    limit = int(params.get("limit", default_limit))
+    start = int(params.get("cursor", "0") or 0)
+    chunk = items[start:start + limit]
+    cursor = str(start + limit) if start + limit < len(items) else None
+    return chunk, cursor
+
+
+class FakeXrpcServer:
+    """Serveur dans un thread; `recorded` ({nsid: réponse JSON}) prend le pas sur les fixtures."""
+
+    def __init__(self, fixtures: Fixtures, port: int = 0, latency_s: float = 0.0,
+                 recorded: Optional[Dict[str, Any]] = None):
+        self.fixtures = fixtures
+        self.latency_s = latency_s
+        self.recorded = recorded or {}
+        self.calls: Counter = Counter()
+        self.bytes_out: Counter = Counter()
+        self._rkey = 0
+        self._lock = threading.Lock()
+        self.routes: Dict[str, Callable[[Dict[str, str], Dict[str, Any]], Any]] = {
+            "com.atproto.server.createSession": self._create_session,
+            "com.atproto.server.refreshSession": self._create_session,
+            "com.atproto.server.getSession": lambda p, b: {"handle": ME_HANDLE, "did": ME_DID},
+            "app.bsky.actor.getProfile": lambda p, b: {"did": ME_DID, "handle": ME_HANDLE},
+            "com.atproto.identity.resolveHandle": lambda p, b: {"did": did_for(p.get("handle", ""))},
+            "app.bsky.feed.searchPosts": self._search_posts,
+            "app.bsky.feed.getAuthorFeed": self._author_feed,
+            "app.bsky.notification.listNotifications": self._notifications,
+            "app.bsky.notification.updateSeen": lambda p, b: None,
+            "com.atproto.repo.createRecord": self._create_record,
+            "com.atproto.repo.applyWrites": self._apply_writes,
+        }
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _handle(self) -> None:
+                url = urlparse(self.path)
+                nsid = url.path.rsplit("/", 1)[-1]
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                status, payload = server.dispatch(nsid, params, body)
+                data = b"" if payload is None else json.dumps(payload).encode()
+                with server._lock:
+                    server.calls[nsid] += 1
+                    server.bytes_out[nsid] += len(data)
+                self.send_response(status)
+                if payload is not None:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("RateLimit-Remaining", "1000")
+                self.send_header("RateLimit-Reset", str(int(time.time()) + 300))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeXrpcServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def dispatch(self, nsid: str, params: Dict[str, str], body: Dict[str, Any]):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if nsid in self.recorded:
+            return 200, self.recorded[nsid]
+        route = self.routes.get(nsid)
+        if route is None:
+            return 501, {"error": "MethodNotImplemented", "message": nsid}
+        return 200, route(params, body)
+
+    # --- routes ---
+
+    def _create_session(self, params: Dict[str, str], body: Dict[str, Any]):
+        exp = int(time.time()) + 3600
+        return {"accessJwt": _jwt(exp), "refreshJwt": _jwt(exp + 86400), "handle": ME_HANDLE, "did": ME_DID}
+
+    def _search_posts(self, params: Dict[str, str], body: Dict[str, Any]):
+        # "shard N" sert la N-ième tranche du pool: plusieurs queries couvrent un grand pool
+        items = self.fixtures.search
+        q = params.get("q", "")
+        if q.startswith("shard "):
+            limit = int(params.get("limit", 25))
+            start = int(q.split()[1]) * limit
+            items = items[start:start + limit]
+        posts, cursor = _page(items, params, 25)
+        return {"posts": posts, "cursor": cursor} if cursor else {"posts": posts}
+
+    def _author_feed(self, params: Dict[str, str], body: Dict[str, Any]):
+        items, cursor = _page(self.fixtures.feeds.get(params.get("actor", ""), []), params, 50)
+        return {"feed": items, "cursor": cursor} if cursor else {"feed": items}
+
+    def _notifications(self, params: Dict[str, str], body: Dict[str, Any]):
+        items, cursor = _page(self.fixtures.notifications, params, 50)
+        out = {"notifications": items}
+        if cursor:
+            out["cursor"] = cursor
+        return out
+
+    def _next_ref(self, collection: str) -> Dict[str, str]:
+        with self._lock:
+            self._rkey += 1
+            n = self._rkey
+        return {"uri": f"at://{ME_DID}/{collection}/w{n:06d}", "cid": f"bafyreiwrite{n:06d}"}
+
+    def _create_record(self, params: Dict[str, str], body: Dict[str, Any]):
+        return self._next_ref(body.get("collection", "app.bsky.feed.post"))
+
+    def _apply_writes(self, params: Dict[str, str], body: Dict[str, Any]):
+        results = []
+        for w in body.get("writes", []):
+            ref = self._next_ref(w.get("collection", "app.bsky.feed.post"))
+            results.append({"$type": "com.atproto.repo.applyWrites#createResult", **ref})
+        return {"results": results}
+
+
+def load_seed_texts(path: str) -> List[str]:
+    """Textes de posts tirés d'un JSONL (champ "body" ou "text"), ex. requests.jsonl."""
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            text = rec.get("text") or rec.get("body") or rec.get("title")
+            if text:
+                texts.append(text[:300])
+    return texts
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--pool", type=int, default=40)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--seed-text", help="JSONL dont les champs body/text servent de textes de posts")
+    ap.add_argument("--recorded", help="JSON {nsid: réponse} servi tel quel")
+    args = ap.parse_args()
+    texts = load_seed_texts(args.seed_text) if args.seed_text else None
+    recorded = json.load(open(args.recorded, encoding="utf-8")) if args.recorded else None
+    srv = FakeXrpcServer(Fixtures(pool=args.pool, texts=texts), port=args.port,
+                         latency_s=args.latency_ms / 1000, recorded=recorded)
+    print(f"Fake XRPC on {srv.url} (Ctrl-C to stop)")
+    try:
+        srv.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,10 +1,42 @@
 import os
+import sys
+import argparse
+import base64
 import json
+import queue
 import random
+import re
+import tempfile
+import threading
 import time
 import datetime as dt
-from typing import Dict, Any, List, Optional, Tuple
-from atproto import Client, models as M
+import functools
+import hashlib
+import math
+import struct
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+import httpx
+from atproto import Client, Request, Session, SessionEvent, models as M
+from atproto import exceptions as atp_exc
+
+try:
+    import numpy as np  # optionnel: ranking vectorisé des gros pools de candidats
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    import h2  # noqa: F401  optionnel: HTTP/2 (pip install "httpx[http2]")
+except ImportError:
+    h2 = None  # type: ignore
+
+try:
+    from websockets.sync.client import connect as ws_connect  # optionnel: stream Jetstream
+except ImportError:
+    ws_connect = None  # type: ignore
 
 try:
     from zoneinfo import ZoneInfo  # Python 3.9+
@@ -12,6 +44,11 @@ except Exception:
     from backports.zoneinfo import ZoneInfo  # type: ignore
 
 STATE_FILE = "bot2_state.json"
+PDS_URL = os.getenv("BOT2_PDS_URL") or None  # défaut SDK (bsky.social); serveur local pour les benchs
+SESSION_FILE = os.getenv("BOT2_SESSION_FILE", "bot2_session.txt")  # JWT access/refresh exportés (secret!)
+JOURNAL_FILE = "bot2_state.journal"  # actions du run, rejouées au chargement puis compactées
+DEDUP_FILE = "bot2_dedup.bin"  # Bloom filter par jour des URIs repostées (voir DayBloom)
+METRICS_DIR = os.getenv("BOT2_METRICS_DIR", ".")  # bot2_metrics.json + .prom en fin de run ("" = off)
 
 # --- Time window (Europe/Brussels) ---
 TIMEZONE = "Europe/Brussels"
@@ -20,8 +57,28 @@ EVENING_END = 23    # 23:00 exclu
 QUIET_START = 23    # nuit 23:00
 QUIET_END = 7       # -> 07:00
 
+# Horloge des décisions (cooldowns, expirations, pool, plan du jour): tout passe par _now() et
+# _today(). --record/--replay la figent à l'heure de l'enregistrement (_FROZEN_NOW, heure locale
+# du système avec son offset): le run rejoué voit les mêmes dates, quel que soit le jour du replay.
+_FROZEN_NOW: Optional[dt.datetime] = None
+
+
+def _now() -> dt.datetime:
+    """Maintenant, en UTC (les dates ISO du state se comparent en tant que chaînes)."""
+    if _FROZEN_NOW is not None:
+        return _FROZEN_NOW.astimezone(dt.timezone.utc)
+    return dt.datetime.now(dt.timezone.utc)
+
+
+def _today() -> dt.date:
+    """Date locale du système: celle des index de cooldown."""
+    if _FROZEN_NOW is not None:
+        return _FROZEN_NOW.date()
+    return dt.date.today()
+
+
 def _now_local():
-    return dt.datetime.now(ZoneInfo(TIMEZONE))
+    return _now().astimezone(ZoneInfo(TIMEZONE))
 
 def _is_evening(now_local: dt.datetime) -> bool:
     return EVENING_START <= now_local.hour < EVENING_END
@@ -35,18 +92,29 @@ def _is_quiet(now_local: dt.datetime) -> bool:
 
 # --- Secrets GitHub ---
 HANDLE = os.getenv("BSKY2_HANDLE")
-APP_PASSWORD = os.getenv("BSKY2_APP_PASSWORD")
-if not HANDLE or not APP_PASSWORD:
-    raise SystemExit("Manque BSKY2_HANDLE ou BSKY2_APP_PASSWORD (Secrets GitHub).")
+APP_PASSWORD = os.getenv("BSKY2_APP_PASSWORD")  # vérifiés au login: --replay s'en passe
 
 # --- Réglages sûrs (caps + delays) ---
 MAX_ENGAGEMENTS_PER_RUN = int(os.getenv("BOT2_MAX_ENG_PER_RUN", "3"))  # likes/réponses aux mentions
+NOTIF_PAGE_LIMIT = 50
+NOTIF_MAX_PAGES = int(os.getenv("BOT2_NOTIF_MAX_PAGES", "5"))  # pages lues par run (la suite: au run suivant)
+NOTIF_MAX_AGE_DAYS = float(os.getenv("BOT2_NOTIF_MAX_AGE_DAYS", "3"))  # mentions plus vieilles: ignorées
 MAX_REPOSTS_PER_RUN = int(os.getenv("BOT2_REPOST_LIMIT", "2"))         # ~2 reposts par run
 DELAY_MIN_S = int(os.getenv("BOT2_DELAY_MIN_S", "12"))
 DELAY_MAX_S = int(os.getenv("BOT2_DELAY_MAX_S", "45"))
+RUN_BUDGET_S = int(os.getenv("BOT2_RUN_BUDGET_S", "1200"))          # durée max d'un run (slot Actions)
+DAEMON_RUNS = int(os.getenv("BOT2_DAEMON_RUNS", "5"))                # runs par soirée en mode --daemon
+WRITES_PER_MIN = float(os.getenv("BOT2_WRITES_PER_MIN", "5"))       # plafond dur du token bucket (0 = off)
+WRITE_BURST = int(os.getenv("BOT2_WRITE_BURST", "2"))
+# Écritures groupées: les records d'une étape partent en un seul applyWrites (un seul commit du repo)
+BATCH_WRITES = os.getenv("BOT2_BATCH_WRITES", "0").strip().lower() in ("1", "true", "yes")
+BATCH_MAX = int(os.getenv("BOT2_BATCH_MAX", "50"))  # writes max par appel (le PDS en accepte 200)
 
 # --- Anti-doublon d'URI (durée) ---
 POST_COOLDOWN_DAYS = int(os.getenv("BOT2_POST_COOLDOWN_DAYS", "14"))
+DEDUP_DAILY_CAPACITY = int(os.getenv("BOT2_DEDUP_DAILY_CAPACITY", "500"))  # URIs/jour prévues par tranche
+DEDUP_FP_RATE = float(os.getenv("BOT2_DEDUP_FP_RATE", "0.001"))
+RECENT_POSTS_EXACT_MAX = int(os.getenv("BOT2_RECENT_POSTS_EXACT_MAX", "500"))  # index exact borné
 
 # --- Diversité / Cooldown par source/domaine ---
 COOLDOWN_DAYS = int(os.getenv("BOT2_SOURCE_COOLDOWN_DAYS", "3"))
@@ -71,11 +139,33 @@ def _build_queries() -> List[str]:
         return [LEGACY_QUERY]
     return DEFAULT_QUERIES[:]
 
+DISCOVERY_SEARCH_LIMIT = 40
+# Pagination de la recherche: on suit le cursor tant qu'il manque des candidats éligibles
+SEARCH_MAX_PAGES = int(os.getenv("BOT2_SEARCH_MAX_PAGES", "3"))        # par query
+SEARCH_BUDGET_S = float(os.getenv("BOT2_SEARCH_BUDGET_S", "15"))       # pour toute la recherche d'un refill
+SEARCH_CACHE_TTL_S = int(os.getenv("BOT2_SEARCH_CACHE_TTL_S", "900"))
+# "single": une query tirée au hasard par run; "fanout": toutes les queries en parallèle, fusionnées
+DISCOVERY_MODE = os.getenv("BOT2_DISCOVERY_MODE", "single").strip().lower()
 DISCOVERY_LIKE_LIMIT = int(os.getenv("BOT2_LIKE_LIMIT", "3"))
 DISCOVERY_WEIGHT = float(os.getenv("BOT2_DISCOVERY_WEIGHT", "0.7"))
+# Pool persistant de candidats déjà scorés: on y pioche d'abord, on ne cherche que s'il est bas
+POOL_MAX_AGE_H = float(os.getenv("BOT2_POOL_MAX_AGE_H", "24"))
+POOL_MAX = int(os.getenv("BOT2_POOL_MAX", "200"))
+POOL_LOW = int(os.getenv("BOT2_POOL_LOW", "10"))
+POOL_MIN_SCORE = 2  # même seuil que les reposts via discovery
+# Likes de découverte: tout original avec image, quel que soit son score (comme avant le pool)
+LIKE_MIN_SCORE = float(os.getenv("BOT2_LIKE_MIN_SCORE", "-inf"))
+
+# --- Stream Jetstream (optionnel, --daemon seulement): les posts arrivent en continu dans le pool ---
+STREAM_URL = os.getenv("BOT2_STREAM_URL", "").strip()  # ex. wss://jetstream2.us-east.bsky.network/subscribe
+STREAM_BUFFER = int(os.getenv("BOT2_STREAM_BUFFER", "200"))         # candidats en attente (plein: backpressure)
+STREAM_SOURCES_ONLY = os.getenv("BOT2_STREAM_SOURCES_ONLY", "0").strip().lower() in ("1", "true", "yes")
+STREAM_MAX_LAG_S = float(os.getenv("BOT2_STREAM_MAX_LAG_S", "21600"))  # reprise au plus 6 h en arrière
+STREAM_REWIND_S = 5  # le cursor est reculé un peu à la reprise (doublons filtrés par URI)
 
 # --- Posts originaux (facultatif) ---
 DO_ORIGINAL_POST_WEIGHT = float(os.getenv("BOT2_ORIGINAL_POST_WEIGHT", "0.20"))  # 20% des runs
+MAX_ORIGINAL_POSTS_PER_RUN = int(os.getenv("BOT2_MAX_POSTS_PER_RUN", "1"))  # quand le run poste
 ORIGINAL_POSTS = [
     "Exploring stories in color and motion 🎨✨",
     "Fiction painted in pixels. More soon.",
@@ -91,11 +181,43 @@ APPEND_LINK_PROB = float(os.getenv("BOT2_APPEND_LINK_PROB", "0.5"))
 
 # --- Sources explicites (opt-in) ---
 SOURCE_HANDLES = [h.strip() for h in os.getenv("BOT2_SOURCE_HANDLES", "").split(",") if h.strip()]
+SOURCE_FEED_LIMIT = 5
+QUOTE_FEED_LIMIT = 8
+FEED_MARK_DAYS = 90  # rétention des high-water marks par acteur (feed_marks)
+
+# --- Transport: rate limits, retries, circuit breaker ---
+HTTP_RETRIES = int(os.getenv("BOT2_HTTP_RETRIES", "3"))                  # lectures uniquement
+BACKOFF_BASE_S = float(os.getenv("BOT2_BACKOFF_BASE_S", "1.0"))
+BACKOFF_MAX_S = float(os.getenv("BOT2_BACKOFF_MAX_S", "30"))
+RATELIMIT_FLOOR = int(os.getenv("BOT2_RATELIMIT_FLOOR", "5"))            # ralentir sous ce "remaining"
+CIRCUIT_THRESHOLD = int(os.getenv("BOT2_CIRCUIT_THRESHOLD", "3"))        # échecs consécutifs par endpoint
+CIRCUIT_COOLDOWN_S = float(os.getenv("BOT2_CIRCUIT_COOLDOWN_S", "120"))
+
+# --- Transport: pool de connexions keep-alive, timeouts ---
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("BOT2_HTTP_CONNECT_TIMEOUT_S", "5"))
+HTTP_READ_TIMEOUT_S = float(os.getenv("BOT2_HTTP_READ_TIMEOUT_S", "20"))    # socket bloquée = erreur réseau
+HTTP_KEEPALIVE_S = float(os.getenv("BOT2_HTTP_KEEPALIVE_S", "90"))          # > espacement max des écritures
+HTTP_POOL_SIZE = int(os.getenv("BOT2_HTTP_POOL_SIZE", "8"))
+HTTP2 = os.getenv("BOT2_HTTP2", "1").strip().lower() in ("1", "true", "yes")  # si h2 est installé
+HTTP_COMPRESSION = os.getenv("BOT2_HTTP_COMPRESSION", "1").strip().lower() in ("1", "true", "yes")
+
+# --- Fetch concurrent (requêtes HTTP en vol simultanément, lectures uniquement) ---
+FETCH_CONCURRENCY = int(os.getenv("BOT2_FETCH_CONCURRENCY", "4"))
 
 # --- Compte 1 (seul autorisé à recevoir un quote avec texte + lien en COMMENTAIRE) ---
 QUOTE_HANDLE = os.getenv("BOT2_QUOTE_HANDLE", "loufisart.bsky.social")
 QUOTE_SHARE = float(os.getenv("BOT2_QUOTE_SHARE", "0.5"))  # part cible des quotes dans les reposts
 
+# --- Budget quotidien, réparti sur les runs restants de la soirée ---
+DAILY_PLAN = os.getenv("BOT2_DAILY_PLAN", "1").strip().lower() in ("1", "true", "yes")
+# -1: la moyenne des réglages par run (cap x poids x DAEMON_RUNS), calculée au run
+DAILY_LIKES = int(os.getenv("BOT2_DAILY_LIKES", "-1"))      # likes de découverte
+DAILY_REPOSTS = int(os.getenv("BOT2_DAILY_REPOSTS", "-1"))  # reposts, quotes compris
+DAILY_QUOTES = int(os.getenv("BOT2_DAILY_QUOTES", "-1"))
+DAILY_REPLIES = int(os.getenv("BOT2_DAILY_REPLIES", "-1"))  # likes/réponses aux mentions
+DAILY_POSTS = int(os.getenv("BOT2_DAILY_POSTS", "-1"))      # posts originaux
+PLAN_CATCHUP = float(os.getenv("BOT2_PLAN_CATCHUP", "2"))   # un run fait au plus 2x sa part égale (et ses caps)
+
 # --- Heuristiques "art vs article" ---
 MARKET_DOMAINS = set(
     d.strip()
@@ -116,40 +238,840 @@ KEYWORDS_GOOD = {
 }
 KEYWORDS_BAD = {"article","news","thread","analysis","opinion","market report"}
 
+# --- Poids du score (BOT2_SCORE_WEIGHTS="image=5,market=4,article=-3,...") ---
+SCORE_FEATURES = ("image", "market", "article", "kw_good", "kw_bad", "reply", "repost")
+DEFAULT_SCORE_WEIGHTS = {"image": 5, "market": 4, "article": -3, "kw_good": 2, "kw_bad": -2, "reply": -2, "repost": -2}
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    weights = dict(DEFAULT_SCORE_WEIGHTS)
+    for part in raw.split(","):
+        if "=" not in part:
+            continue
+        name, value = (x.strip() for x in part.split("=", 1))
+        if name not in weights:
+            print(f"[weights] unknown feature '{name}' ignored")
+            continue
+        try:
+            weights[name] = float(value)
+        except ValueError:
+            print(f"[weights] bad value for '{name}': {value!r}")
+    return weights
+
+
+SCORE_WEIGHTS = _parse_weights(os.getenv("BOT2_SCORE_WEIGHTS", ""))
+
 # --- State helpers ---
+# Les historiques sont des index {clé: date ISO du dernier usage}: vérification en O(1),
+# et comme les dates ISO se comparent en tant que chaînes, pas de fromisoformat à chaque check.
+# Chaque index expire selon son propre cooldown (plus de cap fixe en nombre d'entrées).
+STATE_INDEXES = {
+    # nom -> (clé de l'ancien format liste, durée de rétention en jours)
+    "recent_posts": ("uri", POST_COOLDOWN_DAYS),
+    "recent_sources": ("actor", COOLDOWN_DAYS),
+    "recent_domains": ("domain", COOLDOWN_DAYS),
+}
+
+
+def _cutoff(days: int) -> str:
+    return (_today() - dt.timedelta(days=days)).isoformat()
+
+
+def _as_index(entries: Any, key: str) -> Dict[str, str]:
+    """Accepte l'ancien format [{key, ts}] ou le nouveau {key: ts}; garde la date la plus récente."""
+    if isinstance(entries, dict):
+        return {k: v for k, v in entries.items() if k and isinstance(v, str)}
+    idx: Dict[str, str] = {}
+    for it in entries or []:
+        try:
+            k = it.get(key)
+            ts = it.get("ts", "1970-01-01")
+        except AttributeError:
+            continue
+        if k and ts > idx.get(k, ""):
+            idx[k] = ts
+    return idx
+
+
+def _expire_index(idx: Dict[str, str], days: int) -> None:
+    cutoff = _cutoff(days)
+    for k in [k for k, ts in idx.items() if ts < cutoff]:
+        del idx[k]
+
+
+def _normalize_state(s: Dict[str, Any]) -> Dict[str, Any]:
+    # {id: indexedAt} des notifications traitées au-dessus du high-water mark "notif_mark"
+    processed = s.get("processed_notifications")
+    if isinstance(processed, list):
+        processed = {nid: "" for nid in processed if nid}
+    s["processed_notifications"] = processed or {}
+    s.setdefault("notif_mark", "")
+    # {cursor, above, top}: notifications entre "above" et "top" lues; celles sous "above" pas
+    # encore, à reprendre à ce cursor
+    if not isinstance(s.get("notif_resume"), dict):
+        s["notif_resume"] = {}
+    for name, (key, days) in STATE_INDEXES.items():
+        s[name] = _as_index(s.get(name), key)  # {key: ts}
+        _expire_index(s[name], days)
+    # {uri: {cid, author, domains, score, fetched_at[, liked]}} candidats de découverte scorés
+    if not isinstance(s.get("candidate_pool"), dict):
+        s["candidate_pool"] = {}
+    _expire_pool(s)
+    # {actor: {uri, at}}: post le plus récent déjà évalué dans l'author feed de chaque source
+    if not isinstance(s.get("feed_marks"), dict):
+        s["feed_marks"] = {}
+    _expire_feed_marks(s)
+    # {day, done: {kind: [clés d'action]}}: actions du jour (local), pour le budget quotidien
+    if not isinstance(s.get("daily_actions"), dict):
+        s["daily_actions"] = {}
+    # time_us du dernier événement Jetstream versé au pool (reprise du stream)
+    if not isinstance(s.get("stream_cursor"), int):
+        s["stream_cursor"] = 0
+    return s
+
+
+def _expire_feed_marks(s: Dict[str, Any]) -> None:
+    marks = s.setdefault("feed_marks", {})
+    cutoff = _cutoff(FEED_MARK_DAYS)
+    for actor in [a for a, m in marks.items() if not isinstance(m, dict) or m.get("at", "") < cutoff]:
+        del marks[actor]
+
+
+def _pool_cutoff() -> str:
+    return (_now() - dt.timedelta(hours=POOL_MAX_AGE_H)).isoformat(timespec="seconds")
+
+
+def _expire_pool(s: Dict[str, Any]) -> None:
+    pool = s.setdefault("candidate_pool", {})
+    cutoff = _pool_cutoff()
+    for uri in [uri for uri, e in pool.items() if not isinstance(e, dict) or e.get("fetched_at", "") < cutoff]:
+        del pool[uri]
+
+
+# --- Dedup compact des URIs repostées ---
+# recent_posts (exact) est borné à RECENT_POSTS_EXACT_MAX entrées; la fenêtre complète de
+# POST_COOLDOWN_DAYS est couverte par un Bloom filter découpé par jour (une tranche de bits par
+# jour, les tranches hors fenêtre sont simplement jetées), sérialisé dans DEDUP_FILE.
+# Un négatif du Bloom est sûr. Un positif est vérifié dans l'index exact, qui fait foi pour les
+# jours après "recent_posts_floor" (le plus récent jour dont des entrées ont été évincées); pour
+# les jours plus anciens, un positif est pris tel quel (au pire un candidat sauté, jamais un doublon).
+
+class DayBloom:
+    MAGIC = b"B2DB"
+
+    def __init__(self, bits_per_day: int, hashes: int) -> None:
+        self.m = max(8, bits_per_day)
+        self.k = max(1, hashes)
+        self.slices: Dict[str, bytearray] = {}  # "YYYY-MM-DD" -> bits
+
+    @classmethod
+    def sized(cls, capacity: int, fp_rate: float) -> "DayBloom":
+        m = math.ceil(-max(1, capacity) * math.log(fp_rate) / (math.log(2) ** 2))
+        return cls(m, round(m / max(1, capacity) * math.log(2)))
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, key: str, day: str) -> None:
+        bits = self.slices.get(day)
+        if bits is None:
+            bits = self.slices[day] = bytearray((self.m + 7) // 8)
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def days_containing(self, key: str) -> List[str]:
+        positions = self._positions(key)
+        return [day for day, bits in self.slices.items() if all(bits[p >> 3] >> (p & 7) & 1 for p in positions)]
+
+    def expire(self, cutoff: str) -> None:
+        for day in [d for d in self.slices if d < cutoff]:
+            del self.slices[day]
+
+    def to_bytes(self) -> bytes:
+        out = [self.MAGIC, struct.pack("<IBH", self.m, self.k, len(self.slices))]
+        for day in sorted(self.slices):
+            out += [day.encode("ascii"), bytes(self.slices[day])]
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DayBloom":
+        if data[:4] != cls.MAGIC:
+            raise ValueError("not a bot2 dedup file")
+        m, k, n = struct.unpack_from("<IBH", data, 4)
+        bloom, offset, size = cls(m, k), 11, (m + 7) // 8
+        for _ in range(n):
+            day = data[offset:offset + 10].decode("ascii")
+            bloom.slices[day] = bytearray(data[offset + 10:offset + 10 + size])
+            offset += 10 + size
+        if offset != len(data):
+            raise ValueError("truncated dedup file")
+        return bloom
+
+
+def _load_dedup(state: Dict[str, Any]) -> DayBloom:
+    """Bloom du disque; reconstruit depuis l'index exact s'il manque, est illisible ou a été
+    dimensionné autrement (BOT2_DEDUP_* changés)."""
+    wanted = DayBloom.sized(DEDUP_DAILY_CAPACITY, DEDUP_FP_RATE)
+    try:
+        with open(DEDUP_FILE, "rb") as f:
+            bloom = DayBloom.from_bytes(f.read())
+        if (bloom.m, bloom.k) == (wanted.m, wanted.k):
+            bloom.expire(_cutoff(POST_COOLDOWN_DAYS))
+            return bloom
+        print("[dedup] filter parameters changed, rebuilding from recent_posts")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, struct.error) as e:
+        print(f"[dedup err] {e} -> rebuilding from recent_posts")
+    for uri, day in state.get("recent_posts", {}).items():
+        wanted.add(uri, day)
+    return wanted
+
+
+def _save_dedup(bloom: DayBloom) -> None:
+    tmp = DEDUP_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(bloom.to_bytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, DEDUP_FILE)
+
+
+def _trim_recent_posts(state: Dict[str, Any]) -> None:
+    idx = state.setdefault("recent_posts", {})
+    if len(idx) <= RECENT_POSTS_EXACT_MAX:
+        return
+    oldest = sorted(idx, key=idx.get)[:len(idx) - RECENT_POSTS_EXACT_MAX]
+    state["recent_posts_floor"] = max(state.get("recent_posts_floor", ""), idx[oldest[-1]])
+    for uri in oldest:
+        del idx[uri]
+
+
+def _state_json(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Le state tel qu'il est écrit sur disque (sans les objets runtime préfixés par "_")."""
+    return {k: v for k, v in state.items() if not k.startswith("_")}
+
+# --- Journal ---
+# Chaque action ajoute une ligne compacte au journal (coût proportionnel à l'action, pas à
+# l'historique). Le snapshot complet n'est réécrit qu'à la compaction, de façon atomique.
+JOURNAL_COMPACT_EVERY = int(os.getenv("BOT2_JOURNAL_COMPACT_EVERY", "50"))
+_journal_pending = 0  # lignes écrites depuis la dernière compaction
+
+
+def _apply_record(state: Dict[str, Any], rec: Dict[str, Any]) -> None:
+    """Rejoue une entrée de journal. Idempotent: rejouer deux fois ne change rien."""
+    op, key = rec.get("op"), rec.get("k")
+    if not key:
+        return
+    if op == "notif":
+        state.setdefault("processed_notifications", {})[key] = rec.get("ts", "")
+        return
+    if op == "nmark":
+        if key > state.get("notif_mark", ""):
+            state["notif_mark"] = key
+        mark = state["notif_mark"]
+        processed = state.setdefault("processed_notifications", {})
+        for nid in [nid for nid, at in processed.items() if at < mark]:
+            del processed[nid]
+        return
+    if op == "nresume":
+        state["notif_resume"] = rec.get("v") or {}
+        return
+    if op == "cand":
+        state.setdefault("candidate_pool", {})[key] = rec.get("v", {})
+        return
+    if op == "uncand":
+        state.setdefault("candidate_pool", {}).pop(key, None)
+        return
+    if op == "liked":
+        entry = state.setdefault("candidate_pool", {}).get(key)
+        if entry is not None:
+            entry["liked"] = True
+        return
+    if op == "act":
+        # Clés plutôt que compteurs: rejouer l'entrée ne compte pas l'action deux fois
+        day, kind = rec.get("day", ""), rec.get("kind", "")
+        daily = state.setdefault("daily_actions", {})
+        if day > daily.get("day", ""):
+            daily.clear()
+            daily["day"] = day
+        if day == daily.get("day") and kind:
+            done = daily.setdefault("done", {}).setdefault(kind, [])
+            if key not in done:
+                done.append(key)
+        return
+    if op == "scursor":
+        cursor = rec.get("v")
+        if isinstance(cursor, int) and cursor > state.get("stream_cursor", 0):
+            state["stream_cursor"] = cursor
+        return
+    if op == "fmark":
+        marks = state.setdefault("feed_marks", {})
+        mark = rec.get("v") or {}
+        if mark.get("at", "") >= marks.get(key, {}).get("at", ""):  # même "at": la liste "open" a changé
+            marks[key] = mark
+        return
+    name = {"post": "recent_posts", "src": "recent_sources", "dom": "recent_domains"}.get(op)
+    if name:
+        idx = state.setdefault(name, {})
+        ts = rec.get("ts", "1970-01-01")
+        if ts > idx.get(key, ""):
+            idx[key] = ts
+        if op == "post" and "_dedup" in state:
+            state["_dedup"].add(key, ts)
+
+
+def _journal(state: Dict[str, Any], *records: Dict[str, Any]) -> None:
+    global _journal_pending
+    if not records:
+        return
+    for rec in records:
+        _apply_record(state, rec)
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _journal_pending += len(records)
+    if _journal_pending >= JOURNAL_COMPACT_EVERY:
+        save_state(state)
+
+
+def _replay_journal(state: Dict[str, Any]) -> None:
+    if not os.path.exists(JOURNAL_FILE):
+        return
+    with open(JOURNAL_FILE, "rb") as f:
+        data = f.read()
+    good = data.rfind(b"\n") + 1
+    for line in data[:good].splitlines():
+        try:
+            _apply_record(state, json.loads(line))
+        except Exception:
+            continue
+    if good < len(data):
+        # dernière ligne tronquée par un crash: on la coupe pour que les ajouts suivants restent lisibles
+        with open(JOURNAL_FILE, "r+b") as f:
+            f.truncate(good)
+
+
 def load_state() -> Dict[str, Any]:
+    s: Dict[str, Any] = {}
     if os.path.exists(STATE_FILE):
         try:
             with open(STATE_FILE, "r", encoding="utf-8") as f:
                 s = json.load(f)
-            s.setdefault("processed_notifications", [])
-            s.setdefault("recent_sources", [])  # [{actor, ts}]
-            s.setdefault("recent_domains", [])  # [{domain, ts}]
-            s.setdefault("recent_posts", [])    # [{uri, ts}]
-            return s
-        except Exception:
-            pass
-    return {
-        "processed_notifications": [],
-        "recent_sources": [],
-        "recent_domains": [],
-        "recent_posts": [],
-    }
+            if not isinstance(s, dict):
+                raise ValueError(f"snapshot is a JSON {type(s).__name__}, not an object")
+        except Exception as e:
+            # Ne jamais repartir silencieusement d'un state vide: on garde le fichier pour analyse.
+            bad = f"{STATE_FILE}.corrupt-{int(time.time())}"
+            os.replace(STATE_FILE, bad)
+            print(f"[state err] {e} -> moved to {bad}, starting from journal only")
+            s = {}
+    s = _normalize_state(s)
+    s["_dedup"] = _load_dedup(s)
+    _replay_journal(s)
+    return s
 
 
 def save_state(state: Dict[str, Any]) -> None:
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    """Compaction: snapshot atomique (fichier temporaire + rename), puis journal vidé."""
+    global _journal_pending
+    for name, (_, days) in STATE_INDEXES.items():
+        _expire_index(state.setdefault(name, {}), days)
+    _expire_pool(state)
+    _expire_feed_marks(state)
+    _trim_recent_posts(state)
+    if "_dedup" in state:
+        state["_dedup"].expire(_cutoff(POST_COOLDOWN_DAYS))
+        _save_dedup(state["_dedup"])
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_state_json(state), f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
+    # Si on crashe ici, le journal est simplement rejoué (idempotent) au prochain load.
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+    _journal_pending = 0
+
+# --- Métriques du run ---
+# Temps par étape (mur + sommeil), appels par *_compat/safe_* (nombre, erreurs, durée), requêtes
+# HTTP par endpoint (nombre, erreurs, octets reçus), sommeil par cause, candidats scorés/rejetés.
+# Exportées en fin de run: JSON (artefact) + textfile Prometheus (node_exporter). Les valeurs sont
+# celles du dernier run (remises à zéro à chaque run): des gauges, donc pas de suffixe _total.
+# Un candidat est compté une fois, à l'ingestion (page de recherche, author feed, stream): ses
+# features de score sont calculées à la construction du Candidate.
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()  # le fan-out appelle depuis plusieurs threads
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.t0 = time.monotonic()
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.calls: Dict[str, Dict[str, float]] = {}
+            self.http: Dict[str, Dict[str, float]] = {}
+            self.sleep: Dict[str, float] = {}
+            self.scored = 0
+            self.rejected: Dict[str, int] = {}
+
+    @staticmethod
+    def _bump(table: Dict[str, Dict[str, float]], key: str, **values: float) -> None:
+        row = table.setdefault(key, {})
+        for k, v in values.items():
+            row[k] = row.get(k, 0) + v
+
+    @contextmanager
+    def stage(self, name: str):
+        t0, slept0 = time.monotonic(), self.slept_total()
+        try:
+            yield
+        finally:
+            wall, slept = time.monotonic() - t0, self.slept_total() - slept0
+            with self._lock:
+                self._bump(self.stages, name, wall_s=wall, sleep_s=slept)
+
+    def call(self, name: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._bump(self.calls, name, count=1, errors=int(error), seconds=seconds)
+
+    def error(self, name: str) -> None:
+        """Erreur avalée par la fonction (print + return False): l'appel est déjà compté."""
+        with self._lock:
+            self._bump(self.calls, name, errors=1)
+
+    def request(self, endpoint: str, nbytes: int = 0, error: bool = False) -> None:
+        with self._lock:
+            self._bump(self.http, endpoint, requests=1, errors=int(error), bytes=nbytes)
+
+    def slept(self, reason: str, seconds: float) -> None:
+        with self._lock:
+            self.sleep[reason] = self.sleep.get(reason, 0.0) + seconds
+
+    def slept_total(self) -> float:
+        with self._lock:
+            return sum(self.sleep.values())
+
+    def add_scored(self, n: int) -> None:
+        with self._lock:
+            self.scored += n
+
+    def reject(self, reason: str, n: int = 1) -> None:
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + n
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": dt.datetime.fromtimestamp(self.started_at, dt.timezone.utc).isoformat(),
+                "wall_s": round(time.monotonic() - self.t0, 3),
+                "stages": {k: {m: round(v, 3) for m, v in row.items()} for k, row in self.stages.items()},
+                "calls": {k: {m: round(v, 3) for m, v in row.items()} for k, row in self.calls.items()},
+                "http": {k: dict(row) for k, row in self.http.items()},
+                "sleep_s": {k: round(v, 3) for k, v in self.sleep.items()},
+                "candidates": {"scored": self.scored, "rejected": dict(self.rejected)},
+            }
+
+    def prometheus(self) -> str:
+        s = self.summary()
+        lines = [
+            "# TYPE bot2_run_wall_seconds gauge",
+            f"bot2_run_wall_seconds {s['wall_s']}",
+            "# TYPE bot2_run_last_timestamp_seconds gauge",
+            f"bot2_run_last_timestamp_seconds {self.started_at:.0f}",
+        ]
+
+        def family(metric: str, label: str, rows: Dict[str, Any], field: Optional[str] = None) -> None:
+            lines.append(f"# TYPE {metric} gauge")
+            for key, row in sorted(rows.items()):
+                value = row if field is None else row.get(field, 0)
+                lines.append(f'{metric}{{{label}="{key}"}} {value}')
+
+        family("bot2_stage_wall_seconds", "stage", s["stages"], "wall_s")
+        family("bot2_stage_sleep_seconds", "stage", s["stages"], "sleep_s")
+        family("bot2_calls", "fn", s["calls"], "count")
+        family("bot2_call_errors", "fn", s["calls"], "errors")
+        family("bot2_call_seconds", "fn", s["calls"], "seconds")
+        family("bot2_http_requests", "endpoint", s["http"], "requests")
+        family("bot2_http_errors", "endpoint", s["http"], "errors")
+        family("bot2_http_received_bytes", "endpoint", s["http"], "bytes")
+        family("bot2_sleep_seconds", "reason", s["sleep_s"])
+        family("bot2_candidates_rejected", "reason", s["candidates"]["rejected"])
+        lines += ["# TYPE bot2_candidates_scored gauge", f"bot2_candidates_scored {self.scored}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str) -> None:
+        """Écrit bot2_metrics.json et bot2_metrics.prom (atomique: node_exporter lit à tout moment)."""
+        os.makedirs(directory, exist_ok=True)
+        outputs = {
+            "bot2_metrics.json": json.dumps(self.summary(), ensure_ascii=False, indent=2),
+            "bot2_metrics.prom": self.prometheus(),
+        }
+        for name, text in outputs.items():
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+
+
+METRICS = Metrics()
+
+
+def _instrumented(fn):
+    """Compte appels, durée et exceptions de fn sous son nom dans METRICS."""
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        t0 = time.monotonic()
+        error = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            METRICS.call(fn.__name__, time.monotonic() - t0, error)
+    return wrapper
+
+# --- Transport XRPC ---
+
+class CircuitOpenError(atp_exc.AtProtocolError):
+    """Endpoint coupé après trop d'échecs consécutifs: on n'essaie même pas."""
+
+
+_jitter = random.Random()  # RNG séparé: les retries ne décalent pas les tirages des décisions
+
+
+class ThrottledRequest(Request):
+    """Transport du Client, sous tous les *_compat et safe_*.
+
+    - lit RateLimit-Remaining/RateLimit-Reset et ralentit avant d'atteindre la limite;
+    - réessaie les lectures (GET) sur 429/5xx/erreur réseau, backoff exponentiel avec jitter;
+    - ouvre un circuit par endpoint après CIRCUIT_THRESHOLD échecs consécutifs.
+    Les écritures (POST) ne sont jamais rejouées: un POST incertain pourrait créer un doublon.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._limits: Dict[str, Tuple[int, float]] = {}  # endpoint -> (remaining, reset epoch)
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        return url.rsplit("/", 1)[-1]
+
+    def _note_limits(self, endpoint: str, headers: Any) -> None:
+        try:
+            remaining = int(headers.get("ratelimit-remaining"))
+            reset = float(headers.get("ratelimit-reset"))
+        except (TypeError, ValueError, AttributeError):
+            return
+        with self._lock:
+            self._limits[endpoint] = (remaining, reset)
+
+    def _pace(self, endpoint: str) -> None:
+        with self._lock:
+            remaining, reset = self._limits.get(endpoint, (RATELIMIT_FLOOR + 1, 0.0))
+        if remaining > RATELIMIT_FLOOR:
+            return
+        # Répartir le peu de requêtes restantes jusqu'au reset (attente complète si épuisé)
+        window = max(0.0, reset - time.time())
+        wait = min(window / max(remaining, 1) if remaining > 0 else window, BACKOFF_MAX_S)
+        if wait > 0:
+            print(f"[ratelimit] {endpoint}: remaining={remaining}, waiting {wait:.1f}s")
+            time.sleep(wait)
+            METRICS.slept("ratelimit", wait)
+
+    def _check_circuit(self, endpoint: str) -> None:
+        with self._lock:
+            until = self._open_until.get(endpoint, 0.0)
+        if time.monotonic() < until:
+            raise CircuitOpenError(f"circuit open for {endpoint}")
+
+    def _record(self, endpoint: str, ok: bool) -> bool:
+        """Met à jour le circuit; True s'il vient de s'ouvrir."""
+        with self._lock:
+            if ok:
+                self._failures.pop(endpoint, None)
+                self._open_until.pop(endpoint, None)
+                return False
+            n = self._failures[endpoint] = self._failures.get(endpoint, 0) + 1
+            if n < CIRCUIT_THRESHOLD:
+                return False
+            self._open_until[endpoint] = time.monotonic() + CIRCUIT_COOLDOWN_S
+        print(f"[circuit] {endpoint} open for {CIRCUIT_COOLDOWN_S:.0f}s after {n} failures")
+        return True
+
+    def _send_request(self, method: str, url: str, **kwargs: Any):
+        endpoint = self._endpoint(url)
+        attempts = 1 + (HTTP_RETRIES if method == "GET" else 0)
+        for attempt in range(attempts):
+            self._check_circuit(endpoint)
+            self._pace(endpoint)
+            try:
+                response = super()._send_request(method, url, **kwargs)
+            except atp_exc.RequestErrorBase as e:
+                resp = getattr(e, "response", None)
+                status = getattr(resp, "status_code", None)
+                METRICS.request(endpoint, error=True)
+                if resp is not None:
+                    self._note_limits(endpoint, resp.headers)
+                # 4xx (hors 429) = erreur de notre requête, pas une panne de l'endpoint
+                if status is not None and status != 429 and status < 500:
+                    raise
+                opened = self._record(endpoint, ok=False)
+                if opened or attempt + 1 >= attempts:
+                    raise
+                delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** attempt)) * _jitter.uniform(0.5, 1.5)
+                if status == 429 and resp is not None:
+                    try:
+                        delay = max(delay, min(BACKOFF_MAX_S, float(resp.headers["ratelimit-reset"]) - time.time()))
+                    except (KeyError, TypeError, ValueError):
+                        pass
+                print(f"[retry] {endpoint} ({status or 'network'}) attempt {attempt + 1}/{attempts - 1}, sleeping {delay:.1f}s")
+                time.sleep(delay)
+                METRICS.slept("backoff", delay)
+                continue
+            METRICS.request(endpoint, nbytes=len(response.content or b""))
+            self._note_limits(endpoint, response.headers)
+            self._record(endpoint, ok=True)
+            return response
+        raise CircuitOpenError(endpoint)  # pas atteint
+
+# --- Record / replay (cassette) ---
+# --record ajoute chaque requête XRPC du run (tout ce que font les *_compat, safe_* et le login)
+# et sa réponse à une cassette JSONL; --replay la resert sans réseau, avec la même seed pour
+# random.*, la même config BOT2_* et le même state initial: un run de prod rejoué à l'identique.
+# Rien de secret n'est enregistré: pas de corps de requête, et les réponses de session sont
+# réduites à {did, handle} (des JWT factices sont fabriqués au replay).
+
+CASSETTE_HEADERS = ("content-type", "ratelimit-limit", "ratelimit-remaining", "ratelimit-reset")
+_SESSION_NSIDS = {
+    "com.atproto.server.createSession",
+    "com.atproto.server.refreshSession",
+    "com.atproto.server.getSession",
+}
+
+
+def _cassette_key(request: httpx.Request) -> Tuple[str, str, str]:
+    nsid = request.url.path.rsplit("/", 1)[-1]
+    query = urlencode(sorted(parse_qsl(request.url.query.decode()))) if request.method == "GET" else ""
+    return request.method, nsid, query
+
+
+def _fake_jwt(did: str, exp: int) -> str:
+    def b64(d: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(d).encode()).rstrip(b"=").decode()
+
+    return f"{b64({'alg': 'none', 'typ': 'JWT'})}.{b64({'sub': did, 'exp': exp, 'scope': 'com.atproto.access'})}.replay"
+
+
+class CassetteMiss(BaseException):
+    """Le replay demande une requête absente de la cassette: le run a divergé de l'enregistrement.
+    BaseException: aucun `except Exception` du pipeline (SDK compris) ne doit l'avaler."""
+
+
+class Cassette(httpx.BaseTransport):
+    """Transport httpx du Client en mode record (réseau + journal) ou replay (cassette seule).
+
+    En replay, les réponses sont servies par file FIFO par (méthode, nsid, paramètres GET):
+    le fan-out parallèle peut changer l'ordre des requêtes sans changer qui reçoit quoi.
+    """
+
+    def __init__(self, path: str, mode: str, header: Dict[str, Any]) -> None:
+        self.path = path
+        self.mode = mode
+        self.header = header
+        self._lock = threading.Lock()
+        self._queues: Dict[Tuple[str, str, str], deque] = {}
+        self._t0 = time.monotonic()
+        self._did = "did:plc:replay"
+        self._inner: Optional[httpx.HTTPTransport] = None
+        self._f = None
+        self.requests = 0  # requêtes enregistrées (record) ou servies (replay), hors session
+
+    @classmethod
+    def record(cls, path: str, seed: int, state: Dict[str, Any]) -> "Cassette":
+        header = {
+            "type": "header",
+            "version": 1,
+            "seed": seed,
+            "handle": HANDLE,
+            "recorded_at": _now().astimezone().isoformat(),  # heure locale du système, avec son offset
+            "env": {k: v for k, v in os.environ.items() if k.startswith("BOT2_")},
+            "state": _state_json(state),
+            "dedup": base64.b64encode(state["_dedup"].to_bytes()).decode() if "_dedup" in state else None,
+        }
+        c = cls(path, "record", header)
+        c._inner = _new_transport()
+        c._f = open(path, "w", encoding="utf-8")
+        c._write(header)
+        return c
+
+    @classmethod
+    def replay(cls, path: str) -> "Cassette":
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or lines[0].get("type") != "header":
+            raise SystemExit(f"{path}: pas une cassette bot2 (en-tête manquant).")
+        c = cls(path, "replay", lines[0])
+        for e in lines[1:]:
+            if e.get("nsid") in _SESSION_NSIDS:
+                c._did = (e.get("body") or {}).get("did") or c._did
+                continue
+            c._queues.setdefault((e["method"], e["nsid"], e.get("query", "")), deque()).append(e)
+        return c
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            if entry.get("type") == "http" and entry.get("nsid") not in _SESSION_NSIDS:
+                self.requests += 1
+            self._f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._f.flush()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "record":
+            return self._record(request)
+        return self._replay(request)
+
+    def _record(self, request: httpx.Request) -> httpx.Response:
+        method, nsid, query = _cassette_key(request)
+        entry: Dict[str, Any] = {"type": "http", "method": method, "nsid": nsid, "query": query,
+                                 "t": round(time.monotonic() - self._t0, 3)}
+        t0 = time.monotonic()
+        try:
+            response = self._inner.handle_request(request)
+            response.read()
+        except httpx.TransportError as e:
+            entry.update(error=type(e).__name__, ms=round((time.monotonic() - t0) * 1000, 1))
+            self._write(entry)
+            raise
+        entry.update(
+            status=response.status_code,
+            ms=round((time.monotonic() - t0) * 1000, 1),
+            headers={k: v for k, v in response.headers.items() if k.lower() in CASSETTE_HEADERS},
+        )
+        if nsid in _SESSION_NSIDS:
+            try:
+                body = json.loads(response.content)
+                entry["body"] = {"did": body.get("did"), "handle": body.get("handle")}
+            except ValueError:
+                entry["body"] = {}
+        else:
+            try:
+                entry["body"] = response.content.decode("utf-8")
+            except UnicodeDecodeError:
+                entry["body_b64"] = base64.b64encode(response.content).decode()
+        self._write(entry)
+        return response
+
+    def _replay(self, request: httpx.Request) -> httpx.Response:
+        key = _cassette_key(request)
+        if key[1] in _SESSION_NSIDS:
+            exp = int(time.time()) + 3600
+            return httpx.Response(200, request=request, json={
+                "did": self._did, "handle": self.header.get("handle"),
+                "accessJwt": _fake_jwt(self._did, exp), "refreshJwt": _fake_jwt(self._did, exp + 86400),
+            })
+        with self._lock:
+            queue = self._queues.get(key)
+            entry = queue.popleft() if queue else None
+            if entry is not None:
+                self.requests += 1
+        if entry is None:
+            raise CassetteMiss(f"{' '.join(k for k in key if k)} (after {self.requests} replayed request(s))")
+        if "error" in entry:
+            exc = getattr(httpx, entry["error"], httpx.TransportError)
+            raise exc(f"replayed {entry['error']}", request=request)
+        content = base64.b64decode(entry["body_b64"]) if "body_b64" in entry else entry.get("body", "").encode()
+        return httpx.Response(entry["status"], headers=entry.get("headers", {}), content=content, request=request)
+
+    def unplayed(self) -> int:
+        """Requêtes enregistrées que le replay n'a pas demandées."""
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def close(self) -> None:
+        if self._inner is not None:
+            self._inner.close()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+_CASSETTE: Optional[Cassette] = None
+
+# --- Pool HTTP ---
+# Un seul pool keep-alive par process, sous tous les Client (re-login, daemon, --accounts): les
+# connexions TLS survivent d'un appel à l'autre. Par défaut httpx les ferme après 5s d'inactivité,
+# soit avant chaque écriture espacée par le scheduler.
+
+_SHARED_TRANSPORT: Optional[httpx.BaseTransport] = None
+
+
+def _new_transport() -> httpx.HTTPTransport:
+    return httpx.HTTPTransport(
+        http2=HTTP2 and h2 is not None,
+        limits=httpx.Limits(
+            max_connections=max(HTTP_POOL_SIZE, FETCH_CONCURRENCY),
+            max_keepalive_connections=max(HTTP_POOL_SIZE, FETCH_CONCURRENCY),
+            keepalive_expiry=HTTP_KEEPALIVE_S,
+        ),
+        retries=1,  # échec de connexion uniquement: rien n'a été envoyé, sûr même pour un POST
+    )
+
+
+def _http_transport() -> httpx.BaseTransport:
+    global _SHARED_TRANSPORT
+    if _SHARED_TRANSPORT is None:
+        _SHARED_TRANSPORT = _new_transport()
+    return _SHARED_TRANSPORT
+
+
+def _http_client_options() -> Dict[str, Any]:
+    """Options du httpx.Client de chaque ThrottledRequest (le pool, lui, est partagé)."""
+    options: Dict[str, Any] = {
+        "timeout": httpx.Timeout(HTTP_READ_TIMEOUT_S, connect=HTTP_CONNECT_TIMEOUT_S),
+    }
+    if not HTTP_COMPRESSION:
+        options["headers"] = {"Accept-Encoding": "identity"}  # sinon: gzip/deflate (+br, zstd si installés)
+    return options
 
 # --- SDK compat ---
 
-def list_notifications_compat(client: Client, limit: int = 40):
+@_instrumented
+def list_notifications_compat(client: Client, limit: int = 40, cursor: Optional[str] = None):
+    extra = {"cursor": cursor} if cursor else {}
     try:
-        return client.app.bsky.notification.list_notifications(limit=limit)
+        return client.app.bsky.notification.list_notifications(limit=limit, **extra)
     except TypeError:
-        return client.app.bsky.notification.list_notifications()
+        try:
+            return client.app.bsky.notification.list_notifications(params={"limit": limit, **extra})
+        except TypeError:
+            return client.app.bsky.notification.list_notifications()
 
 
+@_instrumented
+def update_seen_compat(client: Client, seen_at: str) -> bool:
+    try:
+        client.app.bsky.notification.update_seen({"seen_at": seen_at})
+        return True
+    except Exception as e:
+        print(f"[update seen err] {e}")
+        METRICS.error("update_seen_compat")
+        return False
+
+
+@_instrumented
 def get_author_feed_compat(client: Client, actor: str, limit: int = 5):
     try:
         return client.app.bsky.feed.get_author_feed(actor=actor, limit=limit)
@@ -157,150 +1079,681 @@ def get_author_feed_compat(client: Client, actor: str, limit: int = 5):
         return client.app.bsky.feed.get_author_feed(params={"actor": actor, "limit": limit})
 
 
-def search_posts_compat(client: Client, q: str, limit: int = 25):
+@_instrumented
+def resolve_handle_compat(client: Client, handle: str) -> Optional[str]:
+    try:
+        try:
+            return client.com.atproto.identity.resolve_handle(params={"handle": handle}).did
+        except TypeError:
+            return client.com.atproto.identity.resolve_handle({"handle": handle}).did
+    except Exception as e:
+        print(f"[resolve handle err:{handle}] {e}")
+        METRICS.error("resolve_handle_compat")
+        return None
+
+
+def _parallel_map(fn, items: List[Any]) -> Dict[Any, Any]:
+    """{item: fn(item)} avec au plus FETCH_CONCURRENCY appels en vol. fn doit gérer ses erreurs."""
+    if not items:
+        return {}
+    workers = max(1, min(FETCH_CONCURRENCY, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return dict(zip(items, ex.map(fn, items)))
+
+
+# Feeds déjà récupérés (par exemple en tâche de fond pendant une attente du scheduler), en Candidates
+_feed_cache: Dict[Tuple[str, int], Tuple[float, List[Any]]] = {}
+_feed_cache_lock = threading.Lock()
+
+
+class FeedDelta(NamedTuple):
+    """Items d'un author feed plus récents que le mark de l'acteur, plus ceux que le mark garde
+    ouverts (reposts exclus, plus récent d'abord). newest: le mark à enregistrer
+    (_advance_feed_mark) une fois ces items évalués.
+    """
+    feed: List[Any]  # Candidates
+    newest: Optional[Dict[str, str]] = None
+
+
+def _feed_since(items: List[Any], mark: Optional[Dict[str, Any]]) -> FeedDelta:
+    pending = set((mark or {}).get("open") or [])  # sous le mark, mais écartés pour une raison passagère
+    fresh = []
+    newest = None
+    for c in items:
+        if c.is_repost:
+            continue  # repost: jamais candidat, et sa date est celle du post d'origine
+        if mark and (c.uri == mark.get("uri") or (c.indexed_at and c.indexed_at <= mark.get("at", ""))):
+            if c.uri in pending:
+                pending.discard(c.uri)
+                fresh.append(c)
+            if not pending:
+                break  # déjà évalué, et tout ce qui suit est plus ancien
+            continue
+        if newest is None:
+            newest = {"uri": c.uri, "at": c.indexed_at}
+        fresh.append(c)
+    if newest is None and fresh:
+        newest = {"uri": mark["uri"], "at": mark.get("at", "")}  # rien de neuf: le mark ne recule pas
+    return FeedDelta(fresh, newest)
+
+
+def _advance_feed_mark(state: Dict[str, Any], actor: str, feed: Any, settled=None) -> None:
+    """Avance le mark de l'acteur jusqu'au plus récent item du delta. settled (URIs): seuls ces
+    items sont définitivement traités; les autres restent dans "open" et le prochain run qui lit
+    ce feed les réévalue (tant qu'ils sont dans la page demandée)."""
+    if not isinstance(feed, FeedDelta) or not feed.newest:
+        return
+    mark: Dict[str, Any] = dict(feed.newest)
+    if settled is not None:
+        pending = [c.uri for c in feed.feed if c.uri not in settled]
+        if pending:
+            mark["open"] = pending
+    if mark != state.get("feed_marks", {}).get(actor):
+        _journal(state, {"op": "fmark", "k": actor, "v": mark})
+
+
+def prefetch_author_feeds(client: Client, limits: Dict[str, int], state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Récupère plusieurs author feeds en parallèle (au plus FETCH_CONCURRENCY en vol).
+    limits: {actor: limit}. Retourne {actor: FeedDelta ou None si erreur}.
+
+    Avec state, sync incrémentale: les acteurs en cooldown ne sont pas demandés du tout, un
+    acteur avec un mark est d'abord sondé avec limit=1 (feed inchangé et aucun post ouvert: rien
+    de plus), et seul le FeedDelta des items plus récents que le mark (ou ouverts) est retourné.
+    """
+    if not limits:
+        return {}
+    marks = (state or {}).get("feed_marks", {})
+    skipped = {"cooldown": 0, "unchanged": 0}
+
+    def get(actor: str, limit: int):
+        key = (actor, limit)
+        with _feed_cache_lock:
+            hit = _feed_cache.get(key)
+        if hit and time.monotonic() - hit[0] < SEARCH_CACHE_TTL_S:
+            return hit[1]
+        try:
+            feed = _feed_candidates(get_author_feed_compat(client, actor=actor, limit=limit))
+        except Exception as e:
+            print(f"[prefetch err:{actor}] {e}")
+            return None
+        with _feed_cache_lock:
+            _feed_cache[key] = (time.monotonic(), feed)
+        return feed
+
+    def fetch(actor: str):
+        if state is None:
+            feed = get(actor, limits[actor])
+            return None if feed is None else _feed_since(feed, None)
+        if not _is_cooled(state.get("recent_sources", {}), actor):
+            skipped["cooldown"] += 1
+            return FeedDelta([])
+        mark = marks.get(actor)
+        if mark:
+            probe = get(actor, 1)
+            if probe is None:
+                return None
+            top = probe[0] if probe else None
+            if top is None or (not mark.get("open") and not top.is_repost and not _feed_since(probe, mark).feed):
+                skipped["unchanged"] += 1
+                return FeedDelta([])
+        feed = get(actor, limits[actor])
+        return None if feed is None else _feed_since(feed, mark)
+
+    feeds = _parallel_map(fetch, list(limits))
+    if state is not None and any(skipped.values()):
+        print(f"[feeds] not fetched: {skipped['cooldown']} in cooldown, {skipped['unchanged']} unchanged")
+    return feeds
+
+
+@_instrumented
+def search_posts_compat(client: Client, q: str, limit: int = 25, cursor: Optional[str] = None):
+    extra = {"cursor": cursor} if cursor else {}
     try:
-        return client.app.bsky.feed.search_posts(q=q, limit=limit)
+        return client.app.bsky.feed.search_posts(q=q, limit=limit, **extra)
     except TypeError:
         try:
-            return client.app.bsky.feed.search_posts(params={"q": q, "limit": limit})
+            return client.app.bsky.feed.search_posts(params={"q": q, "limit": limit, **extra})
         except Exception:
+            METRICS.error("search_posts_compat")
             return None
 
+
+class SearchPage(NamedTuple):
+    posts: List[Any]  # Candidates
+    cursor: Optional[str] = None
+
+
+# Cache de recherche: une page (query, cursor, limit) n'est demandée qu'une fois tant que le TTL court.
+_search_cache: Dict[Tuple[str, Optional[str], int], Tuple[float, SearchPage]] = {}
+_search_cache_lock = threading.Lock()  # le fan-out de queries appelle depuis plusieurs threads
+
+
+def search_posts_cached(client: Client, q: str, limit: int = 25, cursor: Optional[str] = None) -> Optional[SearchPage]:
+    key = (q, cursor, limit)
+    with _search_cache_lock:
+        now = time.monotonic()
+        for k in [k for k, (at, _) in _search_cache.items() if now - at >= SEARCH_CACHE_TTL_S]:
+            del _search_cache[k]
+        hit = _search_cache.get(key)
+    if hit:
+        return hit[1]
+    res = search_posts_compat(client, q=q, limit=limit, cursor=cursor)
+    if res is None:
+        return None
+    page = SearchPage([Candidate.from_post(p) for p in getattr(res, "posts", []) or []], getattr(res, "cursor", None))
+    METRICS.add_scored(len(page.posts))
+    with _search_cache_lock:
+        _search_cache[key] = (time.monotonic(), page)
+    return page
+
+
+def iter_search(
+    client: Client,
+    q: str,
+    limit: int = 25,
+    eligible=None,
+    until=None,
+    max_pages: int = 1,
+    deadline: Optional[float] = None,
+) -> Iterator[Any]:
+    """Candidates d'une recherche, page par page en suivant le cursor, filtrés par eligible(c).
+
+    La page suivante n'est demandée que si le consommateur en redemande et que until() est faux
+    (assez trouvé), dans la limite de max_pages et de deadline (time.monotonic()).
+    """
+    cursor = None
+    for n in range(max(1, max_pages)):
+        if n and ((until is not None and until()) or (deadline is not None and time.monotonic() >= deadline)):
+            return
+        page = search_posts_cached(client, q=q, limit=limit, cursor=cursor)
+        if page is None:
+            return
+        for c in page.posts:
+            if eligible is None or eligible(c):
+                yield c
+        cursor = page.cursor
+        if not cursor:
+            return
+
 # --- Core ---
 
+def _load_session_string() -> Optional[str]:
+    try:
+        with open(SESSION_FILE, "r", encoding="utf-8") as f:
+            saved = f.read().strip()
+        # Ignorer une session d'un autre compte (changement de BSKY2_HANDLE)
+        if saved and Session.decode(saved).handle == HANDLE:
+            return saved
+    except Exception:
+        pass
+    return None
+
+
+def _save_session_string(session_string: str) -> None:
+    tmp = SESSION_FILE + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(session_string)
+    os.replace(tmp, SESSION_FILE)
+
+
 def login() -> Client:
-    c = Client()
+    """Réutilise la session persistée (pas de createSession, limité en débit) et ne fait un
+    login complet que si elle est absente ou si son refresh échoue.
+    """
+    if not HANDLE or not APP_PASSWORD:
+        raise SystemExit("Manque BSKY2_HANDLE ou BSKY2_APP_PASSWORD (Secrets GitHub).")
+    transport = _CASSETTE or _http_transport()
+    c = Client(base_url=PDS_URL, request=ThrottledRequest(transport=transport, **_http_client_options()))
+
+    def on_session_change(event: SessionEvent, session: Session) -> None:
+        if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+            try:
+                _save_session_string(c.export_session_string())
+            except Exception as e:
+                print(f"[session save err] {e}")
+
+    c.on_session_change(on_session_change)
+    saved = _load_session_string()
+    if saved:
+        try:
+            # Le getProfile du login valide la session; le SDK rafraîchit l'access JWT s'il a expiré.
+            c.login(session_string=saved)
+            print("Session reused.")
+            return c
+        except Exception as e:
+            print(f"[session reuse err] {e} -> full login")
     c.login(HANDLE, APP_PASSWORD)
     return c
 
 
-def random_sleep():
-    time.sleep(random.uniform(DELAY_MIN_S, DELAY_MAX_S))
+# --- Scheduler d'actions ---
+# L'espacement "humain" entre deux écritures est conservé (DELAY_MIN_S..DELAY_MAX_S), mais il
+# n'est plus dormi juste après l'écriture: il n'est attendu qu'avant l'écriture suivante. Entre-temps
+# le run continue (fetchs, scoring, state) et les tâches en file s'exécutent pendant l'attente.
 
+class TokenBucket:
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = rate_per_s
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
 
-def fetch_mentions_and_replies(client: Client, state: Dict[str, Any]) -> List[Any]:
-    res = list_notifications_compat(client, limit=50)
-    items = getattr(res, "notifications", []) or []
-    processed = set(state.get("processed_notifications", []))
-    fresh = []
-    for n in items:
-        reason = getattr(n, "reason", None)
-        if reason not in ("mention", "reply"):
-            continue
-        nid = getattr(n, "cid", None) or getattr(n, "id", None) or getattr(n, "uri", None)
-        if not nid or nid in processed:
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class ActionScheduler:
+    def __init__(self, budget_s: Optional[float] = None):
+        self.bucket = TokenBucket(WRITES_PER_MIN / 60.0, WRITE_BURST)
+        self.idle: deque = deque()  # tâches (fetchs) à exécuter pendant les attentes
+        self.start(budget_s)
+
+    def start(self, budget_s: Optional[float] = None) -> None:
+        """(Re)démarre le budget d'un run (RUN_BUDGET_S par défaut, lu à l'appel: propre au compte)."""
+        self.deadline = time.monotonic() + (RUN_BUDGET_S if budget_s is None else budget_s)
+        self.next_write_at = 0.0
+        self.slept = 0.0
+        self.idle.clear()  # tâches d'un run précédent interrompu (client périmé)
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def exhausted(self) -> bool:
+        return self.remaining() <= 0
+
+    def defer(self, fn, *args, **kwargs) -> None:
+        self.idle.append((fn, args, kwargs))
+
+    def run_idle(self) -> None:
+        while self.idle:
+            fn, args, kwargs = self.idle.popleft()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"[idle task err] {e}")
+
+    def acquire_write(self) -> bool:
+        """Attend le créneau de la prochaine écriture; False si le budget du run ne le permet pas."""
+        self.run_idle()
+        wait = max(self.next_write_at - time.monotonic(), self.bucket.wait_time(), 0.0)
+        if time.monotonic() + wait > self.deadline:
+            print("[scheduler] run budget exhausted, write skipped.")
+            METRICS.reject("run_budget")
+            return False
+        if wait > 0:
+            time.sleep(wait)
+            self.slept += wait
+            METRICS.slept("write_spacing", wait)
+        self.bucket.take()
+        return True
+
+    def done_write(self) -> None:
+        self.next_write_at = time.monotonic() + random.uniform(DELAY_MIN_S, DELAY_MAX_S)
+
+
+SCHEDULER = ActionScheduler()
+
+
+def _notif_id(n) -> Optional[str]:
+    return getattr(n, "cid", None) or getattr(n, "id", None) or getattr(n, "uri", None)
+
+
+class NotifScan(NamedTuple):
+    newest: str  # indexedAt le plus récent vu
+    resume: Dict[str, str]  # {cursor, above, top}: ce qui reste à lire au prochain run ({}: rien)
+
+
+def _notif_floor(state: Dict[str, Any]) -> str:
+    """indexedAt le plus ancien encore à lire: le mark, ou NOTIF_MAX_AGE_DAYS en arrière s'il est
+    plus ancien (on ne répond pas à une mention vieille de plusieurs jours)."""
+    cutoff = (_now() - dt.timedelta(days=NOTIF_MAX_AGE_DAYS)).strftime("%Y-%m-%dT%H:%M:%S")
+    return max(state.get("notif_mark", ""), cutoff)
+
+
+def fetch_mentions_and_replies(client: Client, state: Dict[str, Any]) -> Tuple[List[Any], NotifScan]:
+    """Lit les notifications du plus récent au plus ancien, au plus NOTIF_MAX_PAGES pages par run.
+
+    D'abord la tête, jusqu'à la zone déjà lue; puis la queue laissée par un run précédent
+    (state["notif_resume"]), jusqu'au plancher (_notif_floor). Si les pages manquent, le cursor
+    de la suite est retourné pour le run suivant: rien n'est sauté. Pendant un tel rattrapage, la
+    zone déjà lue n'est pas relue (une mention lue mais pas traitée y reste). Sans mark (premier
+    run), seule la première page est lue, comme avant.
+    Retourne (mentions/réponses non traitées, NotifScan).
+    """
+    first = not state.get("notif_mark")
+    floor = _notif_floor(state)
+    resume = state.get("notif_resume") or {}
+    if not resume.get("cursor") or resume.get("above", "") <= floor:
+        resume = {}  # queue entièrement sous le plancher: trop vieille pour y répondre
+    processed = state.get("processed_notifications", {})
+    fresh: List[Any] = []
+    newest = oldest = ""
+    top = resume.get("top", "")
+    cursor = None
+    tail = False
+    for _ in range(1 if first else max(1, NOTIF_MAX_PAGES)):
+        res = list_notifications_compat(client, limit=NOTIF_PAGE_LIMIT, cursor=cursor)
+        reached = False
+        for n in getattr(res, "notifications", []) or []:
+            at = getattr(n, "indexed_at", "") or ""
+            newest = max(newest, at)
+            if at and (at <= top if resume and not tail else at < floor):
+                reached = True
+                break
+            oldest = at or oldest
+            if getattr(n, "reason", None) not in ("mention", "reply"):
+                continue
+            nid = _notif_id(n)
+            if not nid or nid in processed:
+                continue
+            fresh.append(n)
+        cursor = getattr(res, "cursor", None)
+        if reached and resume and not tail:
+            # Tête raccordée à la zone déjà lue: on reprend la queue là où elle s'était arrêtée
+            tail, cursor, oldest = True, resume["cursor"], resume["above"]
             continue
-        fresh.append(n)
-    return fresh
+        if reached or not cursor:
+            return fresh, NotifScan(newest, {})
+    if first:
+        return fresh, NotifScan(newest, {})
+    # Pages épuisées: tout ce qui est entre `oldest` et le plus récent est lu, la suite au run suivant
+    return fresh, NotifScan(newest, {"cursor": cursor, "above": oldest, "top": max(newest, top)})
+
+
+def _advance_notif_mark(state: Dict[str, Any], unhandled: List[Any], scan: NotifScan) -> None:
+    """Enregistre la reprise, puis avance le mark: jusqu'à la plus ancienne mention restée en
+    attente (ou la plus récente vue) si tout a été lu; sinon seulement jusqu'au plancher d'âge.
+    Une mention en attente plus vieille que NOTIF_MAX_AGE_DAYS ne retient plus le mark.
+    """
+    records = []
+    if scan.resume != (state.get("notif_resume") or {}):
+        records.append({"op": "nresume", "k": "notifications", "v": scan.resume})
+    floor = _notif_floor(state)
+    if scan.resume:
+        new_mark = floor
+    else:
+        pending = [at for at in (getattr(n, "indexed_at", "") or "" for n in unhandled) if at >= floor]
+        new_mark = min(pending) if pending else scan.newest
+    if new_mark and new_mark > state.get("notif_mark", ""):
+        records.append({"op": "nmark", "k": new_mark})
+    _journal(state, *records)
 
 
-def safe_like(client: Client, uri: str, cid: str) -> bool:
-    try:
-        client.like(uri=uri, cid=cid)
+# --- Écritures (directes ou groupées) ---
+# Mode direct: une écriture = un createRecord, espacé par le scheduler. Mode BATCH_WRITES: les
+# safe_* mettent le record en file et WRITES.flush() les commite par applyWrites, en fin d'étape
+# (un créneau du scheduler par appel). Dans les deux modes, le state n'est mis à jour que par le
+# callback on_success, appelé seulement pour un record effectivement créé.
+
+POST_COLLECTION = "app.bsky.feed.post"
+
+
+def _ref(uri: str, cid: str) -> M.ComAtprotoRepoStrongRef.Main:
+    return M.ComAtprotoRepoStrongRef.Main(uri=uri, cid=cid)
+
+
+def _reply_ref(parent: Tuple[str, str], root: Optional[Tuple[str, str]] = None) -> M.AppBskyFeedPost.ReplyRef:
+    """root = racine du thread (le parent lui-même s'il n'est pas une réponse)."""
+    return M.AppBskyFeedPost.ReplyRef(parent=_ref(*parent), root=_ref(*(root or parent)))
+
+
+def _post_record(client: Client, text: str, embed: Any = None, reply: Any = None) -> M.AppBskyFeedPost.Record:
+    # Même record que client.send_post
+    return M.AppBskyFeedPost.Record(
+        created_at=client.get_current_time_iso(), text=text, embed=embed, reply=reply, langs=["en"]
+    )
+
+
+class PendingWrite(NamedTuple):
+    name: str                           # safe_* d'origine (logs, METRICS)
+    collection: str
+    record: Any
+    on_success: Optional[Any] = None    # () -> None, une fois le record créé
+    followup: Optional[Any] = None      # (uri, cid) -> PendingWrite: écriture qui dépend de celle-ci
+
+
+@_instrumented
+def apply_writes_compat(client: Client, writes: List[PendingWrite]):
+    data = M.ComAtprotoRepoApplyWrites.Data(
+        repo=client.me.did,
+        writes=[M.ComAtprotoRepoApplyWrites.Create(collection=w.collection, value=w.record) for w in writes],
+    )
+    return client.com.atproto.repo.apply_writes(data)
+
+
+@_instrumented
+def create_record_compat(client: Client, write: PendingWrite):
+    data = M.ComAtprotoRepoCreateRecord.Data(repo=client.me.did, collection=write.collection, record=write.record)
+    return client.com.atproto.repo.create_record(data)
+
+
+def _write_rejected(e: Exception) -> bool:
+    """applyWrites est atomique: un refus 4xx garantit que rien n'a été écrit, on peut isoler le
+    record fautif. Une erreur réseau ou 5xx laisse le doute (doublons possibles) et un 429 ne
+    passerait pas mieux un par un: pas de repli dans ces cas."""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is not None and status < 500 and status != 429
+
+
+class WriteBatch:
+    def __init__(self) -> None:
+        self.ops: List[PendingWrite] = []
+
+    @property
+    def active(self) -> bool:
+        return BATCH_WRITES
+
+    def add(self, write: PendingWrite) -> bool:
+        self.ops.append(write)
         return True
-    except Exception as e:
-        print(f"[like err] {e}")
-        return False
 
+    def clear(self) -> None:
+        self.ops.clear()
+
+    def flush(self, client: Client) -> int:
+        """Commite la file; les followups (liens en reply) partent dans une 2e phase, une fois
+        l'URI/CID de leur parent connus. Retourne le nombre de records créés."""
+        phase, self.ops = self.ops, []
+        created = 0
+        while phase:
+            followups: List[PendingWrite] = []
+            for i in range(0, len(phase), max(1, BATCH_MAX)):
+                chunk = phase[i:i + max(1, BATCH_MAX)]
+                if not SCHEDULER.acquire_write():
+                    print(f"[batch] {len(phase) - i} write(s) dropped.")
+                    return created
+                try:
+                    refs = self._commit(client, chunk)
+                finally:
+                    SCHEDULER.done_write()
+                for w, ref in zip(chunk, refs):
+                    if ref is None:
+                        continue
+                    created += 1
+                    if w.on_success:
+                        try:
+                            w.on_success()
+                        except Exception as e:
+                            print(f"[{w.name} state err] {e}")
+                    if w.followup:
+                        followups.append(w.followup(*ref))
+            phase = followups
+        return created
+
+    def _commit(self, client: Client, chunk: List[PendingWrite]) -> List[Optional[Tuple[str, str]]]:
+        try:
+            resp = apply_writes_compat(client, chunk)
+            results = getattr(resp, "results", None) or []
+            if len(results) == len(chunk):
+                print(f"[batch] {len(chunk)} write(s) in one applyWrites.")
+                return [(r.uri, r.cid) for r in results]
+            # Commit fait mais réponse inexploitable: pas d'URI, rien à rejouer
+            print(f"[batch err] applyWrites returned {len(results)} result(s) for {len(chunk)} write(s)")
+            return [None] * len(chunk)
+        except Exception as e:
+            print(f"[batch err] {e}")
+            METRICS.error("apply_writes")
+            if not _write_rejected(e):
+                return [None] * len(chunk)
+        # Lot refusé en bloc (un seul record invalide suffit): on isole les fautifs un par un. Chaque
+        # repli est une écriture à part entière: son propre créneau du scheduler (espacement, bucket)
+        refs: List[Optional[Tuple[str, str]]] = []
+        for n, w in enumerate(chunk):
+            SCHEDULER.done_write()  # l'écriture précédente (le lot refusé, ou le repli d'avant)
+            if not SCHEDULER.acquire_write():
+                print(f"[batch] {len(chunk) - n} fallback write(s) dropped.")
+                return refs + [None] * (len(chunk) - n)
+            try:
+                r = create_record_compat(client, w)
+                refs.append((r.uri, r.cid))
+            except Exception as e:
+                print(f"[{w.name} err] {e}")
+                METRICS.error(w.name)
+                refs.append(None)
+        return refs
+
+
+WRITES = WriteBatch()
 
-def safe_repost(client: Client, uri: str, cid: str) -> bool:
+
+def _write_now(name: str, label: str, write, on_success=None) -> bool:
+    """Écriture directe dans un créneau du scheduler; on_success seulement si elle a réussi."""
+    if not SCHEDULER.acquire_write():
+        return False
     try:
-        client.repost(uri=uri, cid=cid)
-        return True
+        write()
     except Exception as e:
-        print(f"[repost err] {e}")
+        print(f"[{label} err] {e}")
+        METRICS.error(name)
         return False
+    finally:
+        SCHEDULER.done_write()
+    if on_success:
+        # Comme dans WriteBatch.flush: le record existe, une erreur de state n'arrête pas l'étape
+        try:
+            on_success()
+        except Exception as e:
+            print(f"[{name} state err] {e}")
+    return True
 
 
-def safe_quote_repost(client: Client, uri: str, cid: str, text: str, link: Optional[str] = None) -> bool:
-    """Quote (embed) a post with optional text. If link is provided, put it in a FOLLOW-UP REPLY
-    so it's clearly clickable on Bluesky.
-    """
-    try:
-        embed = M.AppBskyEmbedRecord.Main(
-            record=M.ComAtprotoRepoStrongRef.Main(uri=uri, cid=cid)
-        )
+def _post_with_link_reply(client: Client, name: str, label: str, text: str, embed: Any = None,
+                          link: Optional[str] = None, on_success=None) -> bool:
+    """Post, puis le lien éventuel en COMMENTAIRE (reply) pour qu'il soit cliquable."""
+    if WRITES.active:
+        def link_reply(uri: str, cid: str) -> PendingWrite:
+            return PendingWrite(name, POST_COLLECTION, _post_record(client, link, reply=_reply_ref((uri, cid))))
+
+        return WRITES.add(PendingWrite(name, POST_COLLECTION, _post_record(client, text, embed=embed), on_success,
+                                       link_reply if link else None))
+
+    def write() -> None:
         resp = client.send_post(text=text, embed=embed)
-        # link en commentaire (reply) pour cliquabilité
         if link:
             try:
-                client.send_post(
-                    text=link,
-                    reply_to=M.AppBskyFeedPost.ReplyRef(
-                        parent=M.AppBskyFeedPost.ReplyRefParent(uri=getattr(resp, "uri", uri), cid=getattr(resp, "cid", cid))
-                    ),
-                )
+                client.send_post(text=link, reply_to=_reply_ref((resp.uri, resp.cid)))
             except Exception as e:
-                print(f"[quote link-reply err] {e}")
-        return True
-    except Exception as e:
-        print(f"[quote err] {e}")
-        return False
+                print(f"[{label} link-reply err] {e}")
+                METRICS.error(name)
 
+    return _write_now(name, label, write, on_success)
+
+
+@_instrumented
+def safe_like(client: Client, uri: str, cid: str, on_success=None) -> bool:
+    if WRITES.active:
+        record = M.AppBskyFeedLike.Record(created_at=client.get_current_time_iso(), subject=_ref(uri, cid))
+        return WRITES.add(PendingWrite("safe_like", "app.bsky.feed.like", record, on_success))
+    return _write_now("safe_like", "like", lambda: client.like(uri=uri, cid=cid), on_success)
+
+
+@_instrumented
+def safe_repost(client: Client, uri: str, cid: str, on_success=None) -> bool:
+    if WRITES.active:
+        record = M.AppBskyFeedRepost.Record(created_at=client.get_current_time_iso(), subject=_ref(uri, cid))
+        return WRITES.add(PendingWrite("safe_repost", "app.bsky.feed.repost", record, on_success))
+    return _write_now("safe_repost", "repost", lambda: client.repost(uri=uri, cid=cid), on_success)
+
+
+@_instrumented
+def safe_quote_repost(client: Client, uri: str, cid: str, text: str, link: Optional[str] = None,
+                      on_success=None) -> bool:
+    """Quote (embed) a post with optional text. If link is provided, put it in a FOLLOW-UP REPLY
+    so it's clearly clickable on Bluesky.
+    """
+    embed = M.AppBskyEmbedRecord.Main(record=_ref(uri, cid))
+    return _post_with_link_reply(client, "safe_quote_repost", "quote", text, embed, link, on_success)
+
+
+@_instrumented
+def safe_reply(client: Client, uri: str, cid: str, text: str, root: Optional[Tuple[str, str]] = None,
+               on_success=None) -> bool:
+    reply = _reply_ref((uri, cid), root)
+    if WRITES.active:
+        return WRITES.add(PendingWrite("safe_reply", POST_COLLECTION, _post_record(client, text, reply=reply), on_success))
+    return _write_now("safe_reply", "reply", lambda: client.send_post(text=text, reply_to=reply), on_success)
 
-def safe_reply(client: Client, uri: str, cid: str, text: str) -> bool:
-    try:
-        client.send_post(
-            text=text,
-            reply_to=M.AppBskyFeedPost.ReplyRef(
-                parent=M.AppBskyFeedPost.ReplyRefParent(uri=uri, cid=cid)
-            ),
-        )
-        return True
-    except Exception as e:
-        print(f"[reply err] {e}")
-        return False
 
 # --- Anti-doublons URI ---
 
 def _uri_recent(state: Dict[str, Any], uri: str) -> bool:
     if not uri:
         return True
-    try:
-        cutoff = dt.date.today() - dt.timedelta(days=POST_COOLDOWN_DAYS)
-        for it in reversed(state.get("recent_posts", [])):
-            if it.get("uri") == uri:
-                when = dt.date.fromisoformat(it.get("ts", "1970-01-01"))
-                if when >= cutoff:
-                    return True
-    except Exception:
-        pass
-    return False
+    cutoff = _cutoff(POST_COOLDOWN_DAYS)
+    ts = state.get("recent_posts", {}).get(uri)
+    if ts is not None and ts >= cutoff:
+        return True
+    bloom = state.get("_dedup")
+    if bloom is None:
+        return False
+    # Positif du Bloom hors index exact: crédible seulement pour les jours dont l'index exact
+    # a perdu des entrées; ailleurs c'est un faux positif
+    floor = state.get("recent_posts_floor", "")
+    return any(cutoff <= day <= floor for day in bloom.days_containing(uri))
 
 
 def _remember_uri(state: Dict[str, Any], uri: str) -> None:
     if not uri:
         return
-    state.setdefault("recent_posts", []).append({"uri": uri, "ts": dt.date.today().isoformat()})
-    state["recent_posts"] = state["recent_posts"][-500:]
-    save_state(state)
+    _journal(state, {"op": "post", "k": uri, "ts": _today().isoformat()})
 
 # --- Diversité / cooldown source & domaine ---
 
-def _is_cooled(entries: List[Dict[str, str]], key: str, value: str) -> bool:
+def _is_cooled(index: Dict[str, str], value: str) -> bool:
     if not value:
         return True
-    try:
-        cutoff = dt.date.today() - dt.timedelta(days=COOLDOWN_DAYS)
-        for it in reversed(entries):
-            if it.get(key) == value:
-                when = dt.date.fromisoformat(it.get("ts", "1970-01-01"))
-                if when >= cutoff:
-                    return False
-    except Exception:
-        pass
-    return True
+    ts = index.get(value)
+    return ts is None or ts < _cutoff(COOLDOWN_DAYS)
+
+
+# Auteurs: la clé commune est le DID (Jetstream ne donne que lui, la recherche et les feeds le
+# donnent aussi). Le handle est gardé en plus quand on le connaît: les SOURCE_HANDLES sont sondés
+# en cooldown avant tout fetch, donc avant de connaître leur DID.
+
+def _source_cooled(state: Dict[str, Any], actor: str, did: str = "") -> bool:
+    index = state.get("recent_sources", {})
+    return _is_cooled(index, actor) and _is_cooled(index, did)
 
 
-def _record_source_and_domain(state: Dict[str, Any], actor: str, domains: List[str]) -> None:
-    if actor:
-        state.setdefault("recent_sources", []).append({"actor": actor, "ts": dt.date.today().isoformat()})
-        state["recent_sources"] = state["recent_sources"][-200:]
+def _record_source_and_domain(state: Dict[str, Any], actor: str, domains: List[str], did: str = "") -> None:
+    today = _today().isoformat()
+    records = [{"op": "src", "k": k, "ts": today} for k in dict.fromkeys((did, actor)) if k]
     if domains:
-        d = domains[0]
-        state.setdefault("recent_domains", []).append({"domain": d, "ts": dt.date.today().isoformat()})
-        state["recent_domains"] = state["recent_domains"][-200:]
-    save_state(state)
+        records.append({"op": "dom", "k": domains[0], "ts": today})
+    _journal(state, *records)
 
 # --- Quote templates (texte sans lien) ---
 QUOTE_TEMPLATES = [
@@ -318,192 +1771,589 @@ def build_quote_text_and_link() -> Tuple[str, str]:
     return text, LINK_OPENSEA
 
 # --- Helpers "art vs article" + util ---
+# Chaque post est réduit une seule fois, à l'ingestion (page de recherche, author feed), en un
+# Candidate compact: filtres et scoring lisent ses attributs au lieu de re-parcourir le modèle SDK.
+# Les mots-clés et domaines sont testés avec une seule regex d'alternation précompilée.
 
-def _get_embed(p):
-    try:
-        return getattr(p, "embed", None)
-    except Exception:
-        return None
+def _compile_any(words) -> "re.Pattern[str]":
+    """Regex qui matche si l'un des mots apparaît (sous-chaîne, comme `k in t`)."""
+    if not words:
+        return re.compile(r"(?!)")  # ne matche jamais
+    return re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
 
 
-def _extract_domains_from_post(p) -> List[str]:
-    domains = []
-    e = _get_embed(p)
-    try:
-        if e and getattr(e, "$type", "").endswith("embed.external#view"):
-            uri = getattr(getattr(e, "external", None), "uri", "") or ""
-            if "://" in uri:
-                domains.append(uri.split("://", 1)[1].split("/", 1)[0].lower())
-        if e and getattr(e, "$type", "").endswith("embed.recordWithMedia#view"):
-            media = getattr(e, "media", None)
-            if media and getattr(media, "$type", "").endswith("embed.external#view"):
-                uri = getattr(getattr(media, "external", None), "uri", "") or ""
-                if "://" in uri:
-                    domains.append(uri.split("://", 1)[1].split("/", 1)[0].lower())
-    except Exception:
-        pass
-    return domains
+_MARKET_RE = _compile_any(MARKET_DOMAINS)
+_ARTICLE_RE = _compile_any(ARTICLE_DOMAINS)
+_GOOD_RE = _compile_any(KEYWORDS_GOOD)
+_BAD_RE = _compile_any(KEYWORDS_BAD)
 
 
-def _has_image_embed(p) -> bool:
-    e = _get_embed(p)
-    try:
-        if e and getattr(e, "$type", "").endswith("embed.images#view"):
-            imgs = getattr(e, "images", []) or []
-            return len(imgs) > 0
-        if e and getattr(e, "$type", "").endswith("embed.recordWithMedia#view"):
-            media = getattr(e, "media", None)
-            if media and getattr(media, "$type", "").endswith("embed.images#view"):
-                imgs = getattr(media, "images", []) or []
-                return len(imgs) > 0
-    except Exception:
-        pass
-    return False
+def _embed_type(e) -> str:
+    # Modèles du SDK: py_type (alias de "$type"); objets bruts: "$type"
+    return getattr(e, "py_type", None) or getattr(e, "$type", "") or ""
 
 
-def _text_of(p) -> str:
-    try:
-        rec = getattr(p, "record", None)
-        return (getattr(rec, "text", None) or "").lower()
-    except Exception:
-        return ""
-
-
-def score_post_for_art(p) -> int:
-    score = 0
-    if _has_image_embed(p):
-        score += 5
-    domains = _extract_domains_from_post(p)
-    if any(any(md in d for md in MARKET_DOMAINS) for d in domains):
-        score += 4
-    if any(any(ad in d for ad in ARTICLE_DOMAINS) for d in domains):
-        score -= 3
-    t = _text_of(p)
-    if any(k in t for k in KEYWORDS_GOOD):
-        score += 2
-    if any(k in t for k in KEYWORDS_BAD):
-        score -= 2
-    try:
-        # Si c'est une réponse ou un repost, on pénalise
+def _domain_of_uri(uri: str) -> Optional[str]:
+    if "://" in uri:
+        return uri.split("://", 1)[1].split("/", 1)[0].lower()
+    return None
+
+
+def _domain_of(e) -> Optional[str]:
+    return _domain_of_uri(getattr(getattr(e, "external", None), "uri", "") or "")
+
+
+def _embed_media(e) -> Tuple[bool, List[str]]:
+    """(image présente?, domaines des liens) d'un embed de post vu par l'AppView."""
+    etype = _embed_type(e) if e else ""
+    if etype.endswith("embed.images#view"):
+        return len(getattr(e, "images", []) or []) > 0, []
+    if etype.endswith("embed.external#view"):
+        return False, [_domain_of(e)]
+    if etype.endswith("embed.recordWithMedia#view"):
+        return _embed_media(getattr(e, "media", None))
+    return False, []
+
+
+def _record_media(e: Any) -> Tuple[bool, List[str]]:
+    """Idem pour l'embed brut (JSON) d'un record de post, tel que le transmet Jetstream."""
+    etype = e.get("$type", "") if isinstance(e, dict) else ""
+    if etype == "app.bsky.embed.images":
+        return len(e.get("images") or []) > 0, []
+    if etype == "app.bsky.embed.external":
+        return False, [_domain_of_uri((e.get("external") or {}).get("uri", "") or "")]
+    if etype == "app.bsky.embed.recordWithMedia":
+        return _record_media(e.get("media"))
+    return False, []
+
+
+class Candidate:
+    """Post réduit à ce que lisent filtres, scoring et pool. features: le vecteur de scoring
+    (ordre de SCORE_FEATURES), calculé à la construction."""
+
+    __slots__ = ("uri", "cid", "author", "did", "text", "has_image", "domains",
+                 "is_reply", "is_repost", "indexed_at", "features")
+
+    def __init__(self, uri: str, cid: str, author: str = "", did: str = "", text: str = "",
+                 has_image: bool = False, domains: Tuple[str, ...] = (), is_reply: bool = False,
+                 is_repost: bool = False, indexed_at: str = "") -> None:
+        self.uri = uri
+        self.cid = cid
+        self.author = author
+        self.did = did
+        self.text = text
+        self.has_image = has_image
+        self.domains = domains
+        self.is_reply = is_reply
+        self.is_repost = is_repost
+        self.indexed_at = indexed_at
+        self.features = (
+            has_image,
+            any(_MARKET_RE.search(d) for d in domains),
+            any(_ARTICLE_RE.search(d) for d in domains),
+            _GOOD_RE.search(text) is not None,
+            _BAD_RE.search(text) is not None,
+            is_reply,
+            is_repost,
+        )
+
+    @classmethod
+    def from_post(cls, p, is_repost: bool = False) -> "Candidate":
+        """is_repost: le post apparaît comme repost dans un author feed (item.reason)."""
+        try:
+            has_image, domains = _embed_media(getattr(p, "embed", None))
+        except Exception:
+            has_image, domains = False, []
         rec = getattr(p, "record", None)
-        if rec is not None and getattr(rec, "reply", None) is not None:
-            score -= 2
-        if getattr(p, "repost", None) is not None:
-            score -= 2
-    except Exception:
-        pass
-    return score
+        author = getattr(p, "author", None)
+        return cls(
+            uri=getattr(p, "uri", "") or "",
+            cid=getattr(p, "cid", "") or "",
+            author=getattr(author, "handle", "") or "",
+            did=getattr(author, "did", "") or "",
+            text=(getattr(rec, "text", None) or "").lower(),
+            has_image=has_image,
+            domains=tuple(d for d in domains if d),
+            # pas de record (vue partielle): traité comme une réponse, jamais candidat original
+            is_reply=rec is None or getattr(rec, "reply", None) is not None,
+            is_repost=is_repost or getattr(p, "repost", None) is not None,
+            indexed_at=getattr(p, "indexed_at", "") or "",
+        )
 
+    @classmethod
+    def from_event(cls, evt: Dict[str, Any], author: str = "") -> "Candidate":
+        """Événement Jetstream de création de post. Jetstream ne donne que le DID: author est le
+        handle pour les SOURCE_HANDLES, le DID sinon (cooldowns et diversité comparent le DID)."""
+        did = evt.get("did", "") or ""
+        commit = evt.get("commit") or {}
+        rec = commit.get("record") or {}
+        has_image, domains = _record_media(rec.get("embed"))
+        t = evt.get("time_us") or 0
+        return cls(
+            uri=f"at://{did}/{commit.get('collection', POST_COLLECTION)}/{commit.get('rkey', '')}",
+            cid=commit.get("cid", "") or "",
+            author=author or did,
+            did=did,
+            text=(rec.get("text") or "").lower(),
+            has_image=has_image,
+            domains=tuple(d for d in domains if d),
+            is_reply=rec.get("reply") is not None,
+            indexed_at=dt.datetime.fromtimestamp(t / 1e6, dt.timezone.utc).isoformat(timespec="seconds"),
+        )
 
-def _actor_of(p) -> str:
-    try:
-        a = getattr(p, "author", None)
-        return getattr(a, "handle", "") or ""
-    except Exception:
-        return ""
 
+def _feed_candidates(feed: Any) -> List[Candidate]:
+    """Items d'un author feed (réponse SDK), dans l'ordre; les reposts de l'acteur ont is_repost."""
+    items = [
+        Candidate.from_post(item.post, is_repost=getattr(item, "reason", None) is not None)
+        for item in getattr(feed, "feed", []) or []
+        if getattr(item, "post", None) is not None
+    ]
+    METRICS.add_scored(len(items))
+    return items
 
-def is_original_post(p) -> bool:
-    """True si le post n'est PAS une réponse (i.e., post racine).
-    Sur Bluesky, l'info est dans record.reply, pas au niveau racine.
-    """
-    try:
-        rec = getattr(p, "record", None)
-        if rec is None:
-            return False
-        # record.reply présent => c'est une réponse
-        return getattr(rec, "reply", None) is None
-    except Exception:
-        return False
 
+_WEIGHT_VECTOR = tuple(SCORE_WEIGHTS[name] for name in SCORE_FEATURES)
 
-def is_from_quote_handle(p) -> bool:
-    try:
-        a = getattr(p, "author", None)
-        handle = getattr(a, "handle", "") or ""
-        return handle == QUOTE_HANDLE
-    except Exception:
-        return False
 
+def score_post_for_art(c: Candidate) -> float:
+    return sum(w for w, x in zip(_WEIGHT_VECTOR, c.features) if x)
 
-def pick_latest_original_post_from_actor(client: Client, actor: str, limit: int = 10):
+
+def score_posts(posts: List[Candidate]) -> List[float]:
+    """Score de tout un pool: une matrice de features x un vecteur de poids (NumPy si dispo)."""
+    if not posts:
+        return []
+    rows = [c.features for c in posts]
+    if np is None:
+        return [sum(w for w, x in zip(_WEIGHT_VECTOR, row) if x) for row in rows]
+    return (np.asarray(rows, dtype=np.float32) @ np.asarray(_WEIGHT_VECTOR, dtype=np.float32)).tolist()
+
+
+def rank_posts(posts: List[Candidate]) -> List[Tuple[float, Candidate]]:
+    """(score, post) par score décroissant; à égalité, l'ordre d'arrivée est gardé."""
+    scores = score_posts(posts)
+    if np is not None and scores:
+        order = np.argsort(-np.asarray(scores), kind="stable").tolist()
+    else:
+        order = sorted(range(len(posts)), key=lambda i: -scores[i])
+    return [(scores[i], posts[i]) for i in order]
+
+
+def pick_latest_original_post_from_actor(client: Client, actor: str, limit: int = 10, feed: Any = None):
     try:
-        feed = get_author_feed_compat(client, actor=actor, limit=limit)
-        for item in (getattr(feed, "feed", []) or []):
-            # Ignorer les REPOSTS du compte source (item.reason present)
-            if getattr(item, "reason", None) is not None:
-                continue
-            post = getattr(item, "post", None)
-            if not post:
-                continue
-            # S'assurer que le post est bien émis par l'acteur demandé
-            try:
-                ph = getattr(getattr(post, "author", None), "handle", "") or ""
-                if ph != actor:
-                    continue
-            except Exception:
+        if feed is None:
+            feed = FeedDelta(_feed_candidates(get_author_feed_compat(client, actor=actor, limit=limit)))
+        for c in feed.feed:
+            # Ignorer les REPOSTS du compte source, et s'assurer que le post est bien de l'acteur
+            if c.is_repost or c.author != actor:
                 continue
             # Strict: uniquement des posts ORIGINAUX AVEC IMAGE
-            if is_original_post(post) and _has_image_embed(post):
-                return post
+            if not c.is_reply and c.has_image:
+                return c
     except Exception as e:
         print(f"[pick original err:{actor}] {e}")
     return None
 
+# --- Discovery pool (partagé par likes et reposts) ---
+# (queries, query tirée): la query reste celle de la tournée tant que la liste ne change pas
+_discovery_query: Optional[Tuple[Tuple[str, ...], str]] = None
+
+
+def _pick_discovery_query() -> str:
+    """Une seule query tirée par run, pour que likes et reposts partagent la même page. En
+    multi-comptes, elle est gardée pour toute la tournée: les comptes qui ont la même liste de
+    queries partagent une seule recherche (cache de recherche)."""
+    global _discovery_query
+    queries = tuple(_build_queries())
+    if _discovery_query is None or _discovery_query[0] != queries:
+        _discovery_query = (queries, random.choice(queries))
+    return _discovery_query[1]
+
+
+def discovery_stream(client: Client, eligible=None, until=None) -> Iterator[Candidate]:
+    """Candidates de découverte au fil des pages (voir iter_search). En fan-out, la première page
+    de chaque query est demandée en parallèle; les suivantes, query par query, seulement si until()
+    reste faux. SEARCH_BUDGET_S borne le tout (et jamais au-delà du budget du run).
+    """
+    deadline = min(time.monotonic() + SEARCH_BUDGET_S, SCHEDULER.deadline)
+    if DISCOVERY_MODE != "fanout":
+        queries = [_pick_discovery_query()]
+    else:
+        queries = _build_queries()
+        _parallel_map(lambda q: search_posts_cached(client, q=q, limit=DISCOVERY_SEARCH_LIMIT), queries)
+    for q in queries:
+        yield from iter_search(client, q, DISCOVERY_SEARCH_LIMIT, eligible=eligible, until=until,
+                               max_pages=SEARCH_MAX_PAGES, deadline=deadline)
+
+
+def discovery_pool(client: Client, eligible=None, until=None) -> List[Tuple[float, Candidate]]:
+    """(score, candidat) de découverte par score décroissant, dédupliqués par URI (et en fan-out,
+    par auteur, au DID: on garde son meilleur post)."""
+    per_author = DISCOVERY_MODE == "fanout"
+    best: Dict[str, Candidate] = {}
+    for c in discovery_stream(client, eligible, until):
+        key = (c.did or c.author or c.uri) if per_author else c.uri
+        prev = best.get(key)
+        if prev is None:
+            best[key] = c
+            continue
+        if prev.uri == c.uri:
+            continue
+        METRICS.reject("same_author")
+        if score_post_for_art(c) > score_post_for_art(prev):  # à égalité, le premier vu reste
+            best[key] = c
+    return rank_posts(list(best.values()))
+
+# --- Pool de candidats persistant ---
+# Les posts de découverte éligibles (originaux, avec image, score >= min(LIKE_MIN_SCORE,
+# POOL_MIN_SCORE)) sont gardés dans le state avec leur score et leur date de fetch: les runs
+# suivants y piochent directement et ne relancent une recherche que quand il reste moins de
+# POOL_LOW candidats utilisables. Les likes prennent tout le pool (score >= LIKE_MIN_SCORE), les
+# reposts seulement les entrées à score >= POOL_MIN_SCORE.
+
+def _pool_entry(c: Candidate, score: float) -> Dict[str, Any]:
+    return {
+        "cid": c.cid,
+        "author": c.author,  # handle (DID pour un post du stream hors SOURCE_HANDLES)
+        "did": c.did,
+        "domains": list(c.domains),
+        "score": score,
+        "fetched_at": _now().isoformat(timespec="seconds"),
+    }
+
+
+def _pool_usable(state: Dict[str, Any], uri: str, e: Dict[str, Any]) -> bool:
+    """Encore repostable maintenant (les cooldowns ont pu changer depuis le fetch)."""
+    # Posts des SOURCE_HANDLES (via le stream): même seuil que les reposts depuis les sources
+    min_score = 1 if e.get("author") in SOURCE_HANDLES else POOL_MIN_SCORE
+    if e.get("score", 0) < min_score or _uri_recent(state, uri):
+        return False
+    if not _source_cooled(state, e.get("author", ""), e.get("did", "")):
+        return False
+    domains = e.get("domains") or []
+    return not (domains and not _is_cooled(state.get("recent_domains", {}), domains[0]))
+
+
+def refill_pool(client: Client, state: Dict[str, Any], want: int = POOL_LOW, usable=None) -> int:
+    """Recherche, score et ajoute au pool les posts éligibles encore absents. La recherche pagine
+    jusqu'à trouver `want` nouveaux candidats qui passent aussi usable(uri, e) (repostables par
+    défaut: cooldowns compris). Retourne le nombre ajouté.
+    """
+    pool = state.setdefault("candidate_pool", {})
+    usable = usable or (lambda uri, e: _pool_usable(state, uri, e))
+    seen = set()
+    found = 0
+
+    def eligible(c: Candidate) -> bool:
+        nonlocal found
+        if not c.uri or not c.cid or c.uri in pool or c.uri in seen:
+            return False
+        if c.is_reply:
+            METRICS.reject("not_original")
+            return False
+        if not c.has_image:
+            METRICS.reject("no_image")
+            return False
+        if _uri_recent(state, c.uri):
+            METRICS.reject("recent_uri")
+            return False
+        score = score_post_for_art(c)
+        if score < min(LIKE_MIN_SCORE, POOL_MIN_SCORE):
+            METRICS.reject("low_score")
+            return False
+        seen.add(c.uri)
+        if usable(c.uri, _pool_entry(c, score)):
+            found += 1
+        return True
+
+    ranked = discovery_pool(client, eligible, until=lambda: found >= want)
+    added = _add_to_pool(state, {c.uri: _pool_entry(c, score) for score, c in ranked})
+    print(f"[pool] refilled: +{added} candidates ({len(pool)} in pool)")
+    return added
+
+
+def _add_to_pool(state: Dict[str, Any], entries: Dict[str, Dict[str, Any]], *extra: Dict[str, Any]) -> int:
+    """Journalise les nouvelles entrées (et `extra`) en un seul append. Au-delà de POOL_MAX, on
+    garde les meilleurs scores (les plus récents à score égal). Retourne le nombre ajouté."""
+    pool = state.setdefault("candidate_pool", {})
+    merged = {**pool, **entries}
+    overflow = sorted(merged, key=lambda u: (merged[u].get("score", 0), merged[u].get("fetched_at", "")))
+    overflow = overflow[:max(0, len(merged) - POOL_MAX)]
+    dropped = set(overflow)
+    records = [{"op": "cand", "k": uri, "v": e} for uri, e in entries.items() if uri not in dropped]
+    _journal(state, *records, *[{"op": "uncand", "k": u} for u in overflow if u in pool], *extra)
+    return len(records)
+
+
+def candidate_pool(client: Client, state: Dict[str, Any], need: int, usable=None) -> List[Tuple[str, Dict[str, Any]]]:
+    """Candidats (uri, entrée) par score décroissant qui passent usable(uri, e) (repostables par
+    défaut). Recherche seulement si le pool n'en a pas assez (moins de max(need, POOL_LOW)).
+    """
+    usable = usable or (lambda uri, e: _pool_usable(state, uri, e))
+    _expire_pool(state)
+    drain_stream(state)
+
+    def ranked() -> List[Tuple[str, Dict[str, Any]]]:
+        pool = state.get("candidate_pool", {})
+        out = [(uri, e) for uri, e in pool.items() if usable(uri, e)]
+        # Score calculé une fois à l'entrée dans le pool (rank_posts): ici un simple tri
+        out.sort(key=lambda it: -it[1].get("score", 0))
+        return out
+
+    found = ranked()
+    if len(found) < max(need, POOL_LOW):
+        refill_pool(client, state, want=max(need, POOL_LOW) - len(found), usable=usable)
+        found = ranked()
+    return found
+
+# --- Stream Jetstream ---
+# Alternative au polling de searchPosts: un thread lit le flux JSON des commits (Jetstream),
+# garde les créations de posts qui passent les mêmes filtres que le pool (originaux, image,
+# score >= POOL_MIN_SCORE; score >= 1 pour les SOURCE_HANDLES) et les met dans un buffer borné.
+# Le pipeline vide ce buffer dans le pool à chaque candidate_pool (et le daemon entre les runs).
+# Buffer plein: le thread attend et ne lit plus la socket (backpressure TCP jusqu'au serveur).
+# Le cursor (time_us) n'avance qu'avec les candidats versés au pool, mais une reprise ne remonte
+# jamais plus de STREAM_MAX_LAG_S en arrière (rétention limitée côté Jetstream): au-delà, le trou
+# est sauté (et loggé). D'où --daemon seulement: en run ponctuel, le stream ne lirait que pendant
+# les quelques minutes du run, buffer plein, et son cursor prendrait du retard à chaque run.
+
+class JetstreamConsumer:
+    def __init__(self, url: str, sources: Dict[str, str], cursor: int = 0, maxsize: int = STREAM_BUFFER):
+        self.url = url
+        self.sources = sources  # {did: handle}
+        self.cursor = cursor  # time_us du dernier événement traité (buffer compris)
+        self.buffer: "queue.Queue[Candidate]" = queue.Queue(maxsize=max(1, maxsize))
+        self.events = 0  # créations de posts lues
+        self.kept = 0
+        self._stop = threading.Event()
+        self._ws: Any = None
+        self._thread = threading.Thread(target=self._loop, name="bot2-stream", daemon=True)
+
+    def start(self) -> "JetstreamConsumer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        self._thread.join(timeout=5)
+
+    def subscribe_url(self) -> str:
+        params = [("wantedCollections", POST_COLLECTION)]
+        if STREAM_SOURCES_ONLY:
+            params += [("wantedDids", did) for did in sorted(self.sources)]
+        if self.cursor:
+            floor = int((time.time() - STREAM_MAX_LAG_S) * 1e6)
+            resume = self.cursor - int(STREAM_REWIND_S * 1e6)
+            if resume < floor:
+                skipped = (floor - resume) / 1e6 / 3600
+                print(f"[stream] saved cursor is older than BOT2_STREAM_MAX_LAG_S: resuming at the floor, "
+                      f"{skipped:.1f}h of events skipped")
+            params.append(("cursor", str(max(resume, floor))))
+        sep = "&" if "?" in self.url else "?"
+        return f"{self.url}{sep}{urlencode(params)}"
+
+    def _loop(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                with ws_connect(self.subscribe_url(), open_timeout=HTTP_CONNECT_TIMEOUT_S,
+                                max_size=2 ** 20) as ws:
+                    self._ws = ws
+                    failures = 0
+                    for raw in ws:
+                        if self._stop.is_set():
+                            return
+                        self._handle(raw)
+                reason = "closed by server"
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+            finally:
+                self._ws = None
+            if self._stop.is_set():
+                return
+            failures += 1
+            delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** failures) * random.uniform(0.5, 1.5)
+            print(f"[stream] {reason}; reconnecting in {delay:.1f}s")
+            self._stop.wait(delay)
+
+    def _handle(self, raw: Any) -> None:
+        try:
+            evt = json.loads(raw)
+        except ValueError:
+            return
+        commit = evt.get("commit") or {}
+        if (evt.get("kind") == "commit" and commit.get("operation") == "create"
+                and commit.get("collection") == POST_COLLECTION and commit.get("rkey")):
+            self.events += 1
+            c = Candidate.from_event(evt, self.sources.get(evt.get("did", ""), ""))
+            METRICS.add_scored(1)
+            if _stream_keep(c, c.did in self.sources):
+                while True:
+                    try:
+                        self.buffer.put(c, timeout=1.0)
+                        break
+                    except queue.Full:
+                        if self._stop.is_set():
+                            return  # cursor laissé avant cet événement
+                self.kept += 1
+        t = evt.get("time_us")
+        if isinstance(t, int) and t > self.cursor:
+            self.cursor = t
+
+    def drain(self) -> Tuple[int, List[Candidate]]:
+        """(cursor, candidats en attente). Le cursor est lu avant de vider le buffer: tout
+        événement antérieur est déjà dans le buffer, donc dans la liste retournée."""
+        cursor = self.cursor
+        items: List[Candidate] = []
+        while True:
+            try:
+                items.append(self.buffer.get_nowait())
+            except queue.Empty:
+                return cursor, items
+
+
+STREAM: Optional[JetstreamConsumer] = None
+
+
+def _stream_keep(c: Candidate, from_source: bool) -> bool:
+    if c.is_reply or not c.has_image or not c.cid:
+        return False
+    return score_post_for_art(c) >= (1 if from_source else POOL_MIN_SCORE)
+
+
+def start_stream(client: Client, state: Dict[str, Any]) -> Optional[JetstreamConsumer]:
+    """Démarre le consumer une fois par process (repris au cursor du state); appelé par le daemon.
+    Sans effet si BOT2_STREAM_URL est vide, en record/replay (hors cassette) ou sans websockets."""
+    global STREAM
+    if STREAM is not None or not STREAM_URL or _CASSETTE is not None:
+        return STREAM
+    if ws_connect is None:
+        print("[stream] BOT2_STREAM_URL set but websockets is not installed; using search only")
+        return None
+    dids = _parallel_map(lambda h: resolve_handle_compat(client, h), SOURCE_HANDLES)
+    sources = {did: h for h, did in dids.items() if did}
+    STREAM = JetstreamConsumer(STREAM_URL, sources, cursor=state.get("stream_cursor", 0)).start()
+    print(f"[stream] consuming {STREAM_URL} ({len(sources)} source DIDs, cursor={state.get('stream_cursor', 0)})")
+    return STREAM
+
+
+def drain_stream(state: Dict[str, Any]) -> int:
+    """Verse le buffer du stream dans le pool et journalise le cursor. Retourne le nombre ajouté."""
+    if STREAM is None:
+        return 0
+    cursor, items = STREAM.drain()
+    pool = state.setdefault("candidate_pool", {})
+    entries = {
+        c.uri: _pool_entry(c, score_post_for_art(c))
+        for c in items
+        if c.uri not in pool and not _uri_recent(state, c.uri)
+    }
+    extra = [{"op": "scursor", "k": "jetstream", "v": cursor}] if cursor > state.get("stream_cursor", 0) else []
+    if not entries and not extra:
+        return 0
+    added = _add_to_pool(state, entries, *extra)
+    if items:
+        lag = max(0.0, time.time() - cursor / 1e6) if cursor else 0.0
+        print(f"[stream] +{added} candidates ({len(pool)} in pool; {STREAM.kept}/{STREAM.events} posts kept, lag {lag:.0f}s)")
+    return added
+
 # --- Pipeline ---
 
+def _thread_root(n) -> Optional[Tuple[str, str]]:
+    """Racine du thread d'une mention qui est elle-même une réponse (None sinon)."""
+    root = getattr(getattr(getattr(n, "record", None), "reply", None), "root", None)
+    uri, cid = getattr(root, "uri", None), getattr(root, "cid", None)
+    return (uri, cid) if uri and cid else None
+
+
+def _after_engagement(state: Dict[str, Any], n: Any, msg: str) -> None:
+    """Appelé une fois le like/la réponse créé: la mention est traitée pour de bon."""
+    _journal(state, {"op": "notif", "k": _notif_id(n), "ts": getattr(n, "indexed_at", "") or ""})
+    _count_action(state, "replies", n.uri)
+    print(msg)
+
+
 def engage_opt_in(client: Client, state: Dict[str, Any]):
-    mentions = fetch_mentions_and_replies(client, state)
+    previous_mark = state.get("notif_mark", "")
+    mentions, scan = fetch_mentions_and_replies(client, state)
     random.shuffle(mentions)
     engagements = 0
+    unusable = set()
     for n in mentions:
-        if engagements >= MAX_ENGAGEMENTS_PER_RUN:
+        if engagements >= MAX_ENGAGEMENTS_PER_RUN or SCHEDULER.exhausted():
             break
         uri = getattr(n, "uri", None)
         cid = getattr(n, "cid", None)
         if not uri or not cid:
+            unusable.add(id(n))  # inexploitable: inutile de la garder en attente
             continue
         if random.random() < 0.75:
-            if safe_like(client, uri, cid):
+            done = functools.partial(_after_engagement, state, n, f"Like mention: {uri}")
+            if safe_like(client, uri, cid, on_success=done):
                 engagements += 1
-                print(f"Like mention: {uri}")
         else:
             reply_text = random.choice(["Thanks!", "Appreciate it 🙏", "Thanks for the tag ✨"]) \
                 if random.random() < 0.7 else random.choice(["✨", "👏", "👍"])
-            if safe_reply(client, uri, cid, reply_text):
+            done = functools.partial(_after_engagement, state, n, f"Reply mention: {uri} -> {reply_text}")
+            if safe_reply(client, uri, cid, reply_text, root=_thread_root(n), on_success=done):
                 engagements += 1
-                print(f"Reply mention: {uri} -> {reply_text}")
-        nid = getattr(n, "cid", None) or getattr(n, "id", None) or getattr(n, "uri", None)
-        if nid:
-            state.setdefault("processed_notifications", []).append(nid)
-            state["processed_notifications"] = state["processed_notifications"][-500:]
-            save_state(state)
-        random_sleep()
+    # Mention traitée = écriture créée (on_success): en mode batch, pas avant le flush. Une
+    # écriture ratée laisse la mention en attente, et le mark en dessous.
+    WRITES.flush(client)
+    processed = state.get("processed_notifications", {})
+    _advance_notif_mark(state, [n for n in mentions if id(n) not in unusable and _notif_id(n) not in processed], scan)
+    if scan.newest and scan.newest > previous_mark:
+        update_seen_compat(client, scan.newest)
 
 
-def maybe_original_post(client: Client):
-    if random.random() >= DO_ORIGINAL_POST_WEIGHT:
+def _after_original_post(state: Optional[Dict[str, Any]], key: str, msg: str) -> None:
+    if state is not None:
+        _count_action(state, "posts", key)
+    print(msg)
+
+
+def maybe_original_post(client: Client, state: Optional[Dict[str, Any]] = None):
+    if MAX_ORIGINAL_POSTS_PER_RUN <= 0 or random.random() >= DO_ORIGINAL_POST_WEIGHT:
         print("Skip original post this run.")
         return
-    text = random.choice(ORIGINAL_POSTS)
-    try:
-        resp = client.send_post(text=text)
-        print(f"Original post: {text} -> {getattr(resp, 'uri', '')}")
+    # Plus d'un post (rattrapage du plan du jour): jamais deux fois le même texte dans un run
+    texts = random.sample(ORIGINAL_POSTS, min(MAX_ORIGINAL_POSTS_PER_RUN, len(ORIGINAL_POSTS)))
+    started = _now().isoformat()
+    for i, text in enumerate(texts):
+        if i and SCHEDULER.exhausted():
+            break
         # Si on décide d'ajouter un lien, on le met en COMMENTAIRE (reply)
+        link = None
         if random.random() < APPEND_LINK_PROB:
             link = LINK_SITE if random.random() < 0.5 else LINK_OPENSEA
-            try:
-                client.send_post(
-                    text=link,
-                    reply_to=M.AppBskyFeedPost.ReplyRef(
-                        parent=M.AppBskyFeedPost.ReplyRefParent(uri=getattr(resp, "uri", ""), cid=getattr(resp, "cid", ""))
-                    ),
-                )
-                print(f"Original post link (in reply): {link}")
-            except Exception as e:
-                print(f"[orig link-reply err] {e}")
-    except Exception as e:
-        print(f"[post err] {e}")
+        done = f"Original post: {text}" + (f" (link in reply: {link})" if link else "")
+        _post_with_link_reply(client, "maybe_original_post", "post", text, link=link,
+                              on_success=functools.partial(_after_original_post, state, f"{started}#{i}", done))
+
+
+def _after_repost(state: Dict[str, Any], uri: str, actor: str, domains: List[str], label: str,
+                  quote: bool = False, did: str = "") -> None:
+    """Appelé une fois le repost/quote créé: URI, cooldowns source/domaine et budget du jour."""
+    _remember_uri(state, uri)
+    _count_action(state, "reposts", uri)
+    if quote:
+        _count_action(state, "quotes", uri)
+    print(f"{label}: {uri}")
+    _record_source_and_domain(state, actor, domains, did=did)
+
+
+def _repost_feed_limits() -> Dict[str, int]:
+    limits = {actor: SOURCE_FEED_LIMIT for actor in SOURCE_HANDLES if actor and actor != QUOTE_HANDLE}
+    if QUOTE_HANDLE and int(round(MAX_REPOSTS_PER_RUN * QUOTE_SHARE)) > 0:
+        limits[QUOTE_HANDLE] = QUOTE_FEED_LIMIT
+    return limits
 
 
 def repost_from_sources_with_quotes(client: Client, state: Dict[str, Any]):
@@ -515,77 +2365,114 @@ def repost_from_sources_with_quotes(client: Client, state: Dict[str, Any]):
     done_reposts = 0
     done_quotes = 0
 
+    # 0) Prefetch concurrent de tous les feeds nécessaires (QUOTE_HANDLE + sources)
+    sources = [h for h in SOURCE_HANDLES if h and h != QUOTE_HANDLE]
+    feeds = prefetch_author_feeds(client, _repost_feed_limits(), state)
+
     # 1) Quote-retweets STRICTEMENT depuis QUOTE_HANDLE et seulement si post ORIGINAL + IMAGE
+    # Le mark d'un feed n'avance que s'il a été évalué jusqu'au bout (ni écriture ratée, ni cooldown)
+    quote_feed = feeds.get(QUOTE_HANDLE)
+    quote_failed = False  # écriture ratée ou candidat en cooldown: à revoir au prochain run
+    queued = set()
     while done_quotes < target_quote_count and done_reposts < MAX_REPOSTS_PER_RUN:
-        p = pick_latest_original_post_from_actor(client, QUOTE_HANDLE, limit=8)
-        if not p or not is_original_post(p) or not is_from_quote_handle(p) or not _has_image_embed(p):
+        p = pick_latest_original_post_from_actor(client, QUOTE_HANDLE, limit=QUOTE_FEED_LIMIT, feed=quote_feed)
+        if not p or p.is_reply or p.author != QUOTE_HANDLE or not p.has_image:
             print("No eligible original image-post from QUOTE_HANDLE to quote.")
             break
-        if _uri_recent(state, getattr(p, "uri", "")):
+        if _uri_recent(state, p.uri):
             print("Skip quote: already posted this URI recently.")
             break
-        actor = _actor_of(p)
-        domains = _extract_domains_from_post(p)
+        actor = p.author
+        domains = list(p.domains)
         dom_key = domains[0] if domains else ""
-        if not _is_cooled(state.get("recent_sources", []), "actor", actor):
+        if not _source_cooled(state, actor, p.did):
+            quote_failed = True
             break
-        if dom_key and not _is_cooled(state.get("recent_domains", []), "domain", dom_key):
+        if dom_key and not _is_cooled(state.get("recent_domains", {}), dom_key):
+            quote_failed = True
             break
+        if p.uri in queued:
+            break  # déjà en file (mode batch): le state ne le saura qu'au flush
         q_text, q_link = build_quote_text_and_link()
-        ok = safe_quote_repost(client, p.uri, p.cid, q_text, link=q_link)
+        done = functools.partial(_after_repost, state, p.uri, actor, domains, f"Quote-retweet from @{QUOTE_HANDLE}",
+                                 quote=True, did=p.did)
+        ok = safe_quote_repost(client, p.uri, p.cid, q_text, link=q_link, on_success=done)
         if ok:
-            _remember_uri(state, getattr(p, "uri", ""))
+            queued.add(p.uri)
             done_quotes += 1
             done_reposts += 1
-            print(f"Quote-retweet from @{QUOTE_HANDLE}: {p.uri}")
-            _record_source_and_domain(state, actor, domains)
-            random_sleep()
         else:
+            quote_failed = True
             break
+    # Flush avant les reposts suivants (leurs cooldowns en dépendent) et avant d'avancer le mark:
+    # une écriture groupée qui a échoué n'est pas dans le state
+    WRITES.flush(client)
+    if not quote_failed and all(_uri_recent(state, u) for u in queued):
+        _advance_feed_mark(state, QUOTE_HANDLE, quote_feed)
 
     # 2) Reposts simples depuis SOURCE_HANDLES (jamais de phrase/lien ici) — seulement posts ORIGINaux AVEC IMAGE
-    sources = [h for h in SOURCE_HANDLES if h and h != QUOTE_HANDLE]
     random.shuffle(sources)
+    # (actor, feed, URIs traitées pour de bon, URI repostée): marks avancés après le flush. Un post
+    # écarté pour une raison passagère (cooldown de domaine ou de source, écriture ratée) n'est pas
+    # "traité": il reste ouvert dans le mark, et le prochain run qui lit ce feed le réévalue.
+    marks = []
+    queued_domains = set()
     for actor in sources:
-        if done_reposts >= MAX_REPOSTS_PER_RUN:
+        if done_reposts >= MAX_REPOSTS_PER_RUN or SCHEDULER.exhausted():
             break
         try:
-            feed = get_author_feed_compat(client, actor=actor, limit=5)
-            for item in (getattr(feed, "feed", []) or []):
-                # Ignorer les reposts (raison présente) et vérifier l'auteur
-                if getattr(item, "reason", None) is not None:
-                    continue
-                post = getattr(item, "post", None)
-                if not post:
+            feed = feeds.get(actor)
+            if feed is None:
+                continue
+            did = next((c.did for c in feed.feed if c.author == actor and c.did), "")
+            if not _source_cooled(state, actor, did):
+                METRICS.reject("source_cooldown")
+                continue  # mark inchangé: ses posts seront lus à la fin du cooldown
+            settled = set()
+            reposted = ""
+            for post in feed.feed:
+                # Ignorer les reposts et vérifier l'auteur
+                if post.is_repost or post.author != actor:
+                    settled.add(post.uri)
                     continue
-                try:
-                    ph = getattr(getattr(post, "author", None), "handle", "") or ""
-                    if ph != actor:
-                        continue
-                except Exception:
+                if post.is_reply:
+                    METRICS.reject("not_original")
+                    settled.add(post.uri)
                     continue
-                if not is_original_post(post) or not _has_image_embed(post):
+                if not post.has_image:
+                    METRICS.reject("no_image")
+                    settled.add(post.uri)
                     continue
-                if _uri_recent(state, getattr(post, "uri", "")):
+                if _uri_recent(state, post.uri):
+                    METRICS.reject("recent_uri")
+                    settled.add(post.uri)
                     continue
-                domains = _extract_domains_from_post(post)
+                domains = list(post.domains)
                 dom_key = domains[0] if domains else ""
-                if not _is_cooled(state.get("recent_sources", []), "actor", actor):
-                    continue
-                if dom_key and not _is_cooled(state.get("recent_domains", []), "domain", dom_key):
+                if dom_key and (dom_key in queued_domains or not _is_cooled(state.get("recent_domains", {}), dom_key)):
+                    METRICS.reject("domain_cooldown")
                     continue
                 if score_post_for_art(post) < 1:
+                    METRICS.reject("low_score")
+                    settled.add(post.uri)
                     continue
-                if safe_repost(client, post.uri, post.cid):
-                    _remember_uri(state, getattr(post, "uri", ""))
+                if reposted:
+                    continue  # un repost par source et par run (cooldown): reste ouvert
+                done = functools.partial(_after_repost, state, post.uri, actor, domains,
+                                         f"Repost (simple, image-only) from {actor}", did=did)
+                if safe_repost(client, post.uri, post.cid, on_success=done):
+                    queued_domains.add(dom_key)
+                    reposted = post.uri
                     done_reposts += 1
-                    print(f"Repost (simple, image-only) from {actor}: {post.uri}")
-                    _record_source_and_domain(state, actor, domains)
-                    random_sleep()
-                    break
+            marks.append((actor, feed, settled, reposted))
         except Exception as e:
             print(f"[source err:{actor}] {e}")
             continue
+    WRITES.flush(client)
+    for actor, feed, settled, reposted in marks:
+        if reposted and _uri_recent(state, reposted):
+            settled.add(reposted)
+        _advance_feed_mark(state, actor, feed, settled)
 
     # 3) Complément via discovery (repost simple) avec tri par score + diversité — seulement posts ORIGINAUX AVEC IMAGE
     if done_reposts < MAX_REPOSTS_PER_RUN:
@@ -596,106 +2483,535 @@ def repost_from_sources_with_quotes(client: Client, state: Dict[str, Any]):
     print(f"Reposts done: {done_reposts} (quotes={done_quotes}, cap={MAX_REPOSTS_PER_RUN})")
 
 
+def _after_discovery_repost(state: Dict[str, Any], uri: str, e: Dict[str, Any]) -> None:
+    _remember_uri(state, uri)
+    _count_action(state, "reposts", uri)
+    _journal(state, {"op": "uncand", "k": uri})
+    print(f"Repost via discovery (image-only): {uri}")
+    _record_source_and_domain(state, e.get("author", ""), e.get("domains") or [], did=e.get("did", ""))
+
+
 def repost_via_discovery(client: Client, state: Dict[str, Any], remaining_needed: int) -> int:
     if remaining_needed <= 0:
         return 0
     try:
-        q = random.choice(_build_queries())
-        res = search_posts_compat(client, q=q, limit=40)
-        posts = getattr(res, "posts", []) or []
-        scored = sorted(posts, key=score_post_for_art, reverse=True)
-        used_authors, used_domains = set(), set()
         count = 0
-        for p in scored:
-            if count >= remaining_needed:
+        queued = set()  # auteurs/domaines déjà en file: cooldowns pas encore dans le state en mode batch
+        for uri, e in candidate_pool(client, state, remaining_needed):
+            if count >= remaining_needed or SCHEDULER.exhausted():
                 break
-            uri = getattr(p, "uri", None)
-            cid = getattr(p, "cid", None)
-            if not uri or not cid:
+            # Un repost met l'auteur et le domaine en cooldown: un seul post par auteur/domaine
+            keys = {e.get("did") or e.get("author", "")} | set((e.get("domains") or [])[:1])
+            if not _pool_usable(state, uri, e) or keys & queued:
+                METRICS.reject("diversity")
                 continue
-            # Strict: pas de commentaires/reposts, uniquement ORIGINaux avec IMAGE
-            if not is_original_post(p) or not _has_image_embed(p):
-                continue
-            if _uri_recent(state, uri):
-                continue
-            actor = _actor_of(p)
-            domains = _extract_domains_from_post(p)
-            dom_key = domains[0] if domains else ""
-            if actor in used_authors:
-                continue
-            if dom_key and dom_key in used_domains:
-                continue
-            if not _is_cooled(state.get("recent_sources", []), "actor", actor):
-                continue
-            if dom_key and not _is_cooled(state.get("recent_domains", []), "domain", dom_key):
-                continue
-            if score_post_for_art(p) < 2:
-                continue
-            if safe_repost(client, uri, cid):
-                _remember_uri(state, uri)
+            done = functools.partial(_after_discovery_repost, state, uri, e)
+            if safe_repost(client, uri, e["cid"], on_success=done):
+                queued |= keys - {""}
                 count += 1
-                used_authors.add(actor)
-                if dom_key:
-                    used_domains.add(dom_key)
-                print(f"Repost via discovery (image-only): {uri}")
-                _record_source_and_domain(state, actor, domains)
-                random_sleep()
         return count
     except Exception as e:
         print(f"[discovery repost err] {e}")
         return 0
 
 
-def discovery_likes_and_maybe_reposts(client: Client):
+def _likeable(e: Dict[str, Any]) -> bool:
+    return not e.get("liked") and e.get("score", 0) >= LIKE_MIN_SCORE
+
+
+def _after_discovery_like(state: Dict[str, Any], uri: str) -> None:
+    _journal(state, {"op": "liked", "k": uri})
+    _count_action(state, "likes", uri)
+    print(f"Discovery like (image): {uri}")
+
+
+def discovery_likes_and_maybe_reposts(client: Client, state: Dict[str, Any]):
     if random.random() >= DISCOVERY_WEIGHT:
         print("Skip discovery this run (weight check).")
         return
+    if DISCOVERY_LIKE_LIMIT <= 0:
+        print("Discovery like cap is 0. Skipping likes.")
+        return
     try:
-        q = random.choice(_build_queries())
-        res = search_posts_compat(client, q=q, limit=40)
-        posts = getattr(res, "posts", []) or []
-        random.shuffle(posts)
+        # Le pool ne contient que des originaux avec image; on ne like pas deux fois le même
+        entries = candidate_pool(client, state, DISCOVERY_LIKE_LIMIT, usable=lambda uri, e: _likeable(e))
+        random.shuffle(entries)
         likes_done = 0
-        for p in posts:
-            if likes_done >= DISCOVERY_LIKE_LIMIT:
+        for uri, e in entries:
+            if likes_done >= DISCOVERY_LIKE_LIMIT or SCHEDULER.exhausted():
                 break
-            # Optionnel: like seulement les posts avec image pour rester dans l'esprit
-            if not _has_image_embed(p):
-                continue
-            uri = getattr(p, "uri", None)
-            cid = getattr(p, "cid", None)
-            if not uri or not cid:
-                continue
-            if safe_like(client, uri, cid):
+            done = functools.partial(_after_discovery_like, state, uri)
+            if safe_like(client, uri, e["cid"], on_success=done):
                 likes_done += 1
-                print(f"Discovery like (image): {uri}")
-                random_sleep()
         print(f"Discovery likes done: {likes_done}/{DISCOVERY_LIKE_LIMIT}")
     except Exception as e:
         print(f"[discovery err] {e}")
 
+# --- Budget quotidien ---
+# Au lieu que chaque run tire ses poids et applique ses caps sans savoir ce que la soirée a déjà
+# fait, chaque type d'action a un budget par jour (local). Un run reçoit ce qui reste, divisé par
+# le nombre de runs encore prévus dans la fenêtre EVENING_START-EVENING_END (DAEMON_RUNS tranches,
+# comme _evening_plan); la part fractionnaire est tirée au sort, pour une moyenne exacte. Un run
+# manqué est rattrapé, mais au plus PLAN_CATCHUP fois la part égale d'un run.
+
+DAILY_KINDS = ("likes", "reposts", "quotes", "replies", "posts")
+
+
+def _count_action(state: Dict[str, Any], kind: str, key: str) -> None:
+    _journal(state, {"op": "act", "k": key, "kind": kind, "day": _now_local().date().isoformat()})
+
+
+def _daily_budget() -> Dict[str, int]:
+    """Budgets du jour; ceux à -1 suivent les réglages par run courants (ceux du compte en --accounts)."""
+    runs = max(1, DAEMON_RUNS)
+    auto = {
+        "likes": round(DISCOVERY_LIKE_LIMIT * DISCOVERY_WEIGHT * runs),
+        "reposts": MAX_REPOSTS_PER_RUN * runs,
+        "quotes": int(round(MAX_REPOSTS_PER_RUN * QUOTE_SHARE)) * runs,
+        "replies": MAX_ENGAGEMENTS_PER_RUN * runs,
+        "posts": round(DO_ORIGINAL_POST_WEIGHT * MAX_ORIGINAL_POSTS_PER_RUN * runs),
+    }
+    set_ = {"likes": DAILY_LIKES, "reposts": DAILY_REPOSTS, "quotes": DAILY_QUOTES,
+            "replies": DAILY_REPLIES, "posts": DAILY_POSTS}
+    return {k: auto[k] if set_[k] < 0 else set_[k] for k in DAILY_KINDS}
+
+
+def _runs_left(now: dt.datetime) -> int:
+    """Runs prévus d'ici la fin de la fenêtre, celui-ci compris (au moins 1)."""
+    runs = max(1, DAEMON_RUNS)
+    hour = now.hour + now.minute / 60
+    if hour < EVENING_START:
+        return runs
+    span = (EVENING_END - EVENING_START) / runs
+    return max(1, min(runs, math.ceil((EVENING_END - hour) / span)))
+
+
+def _run_caps() -> Dict[str, int]:
+    """Caps par run configurés (ceux du compte en --accounts): le plan ne les dépasse jamais."""
+    return {
+        "likes": DISCOVERY_LIKE_LIMIT,
+        "reposts": MAX_REPOSTS_PER_RUN,
+        "quotes": int(round(MAX_REPOSTS_PER_RUN * QUOTE_SHARE)),
+        "replies": MAX_ENGAGEMENTS_PER_RUN,
+        "posts": MAX_ORIGINAL_POSTS_PER_RUN,
+    }
+
+
+def plan_run(state: Dict[str, Any], now: Optional[dt.datetime] = None) -> Dict[str, int]:
+    """Quota de ce run par type d'action."""
+    now = now or _now_local()
+    day = now.date().isoformat()
+    daily = state.get("daily_actions", {})
+    done = daily.get("done", {}) if daily.get("day") == day else {}
+    left = _runs_left(now)
+    caps = _run_caps()
+    quota = {}
+    for kind, budget in _daily_budget().items():
+        share = max(0, budget - len(done.get(kind, []))) / left
+        n = int(share) + (random.random() < share - int(share))
+        catchup = math.ceil(budget * PLAN_CATCHUP / max(1, DAEMON_RUNS))
+        quota[kind] = max(0, min(n, catchup, caps[kind]))
+    print(f"[plan] {day}, {left} run(s) left: " + ", ".join(
+        f"{k}={quota[k]} ({len(done.get(k, []))} done)" for k in DAILY_KINDS))
+    return quota
+
+
+def _plan_globals(quota: Dict[str, int]) -> Dict[str, Any]:
+    """Le quota, traduit en réglages par run (installés pendant le run, comme ceux d'un compte)."""
+    # Un quote compte aussi comme repost: jamais plus de quotes que de reposts restants
+    reposts = quota["reposts"]
+    quotes = min(quota["quotes"], reposts)
+    return {
+        "MAX_ENGAGEMENTS_PER_RUN": quota["replies"],
+        "DO_ORIGINAL_POST_WEIGHT": 1.0 if quota["posts"] else 0.0,
+        "MAX_ORIGINAL_POSTS_PER_RUN": quota["posts"],
+        "DISCOVERY_WEIGHT": 1.0 if quota["likes"] else 0.0,
+        "DISCOVERY_LIKE_LIMIT": quota["likes"],
+        "MAX_REPOSTS_PER_RUN": reposts,
+        "QUOTE_SHARE": quotes / reposts if reposts else 0.0,
+    }
+
 # --- MAIN ---
-if __name__ == "__main__":
-    # Garde-fou horaire
-    now = _now_local()
-    if _is_quiet(now) or not _is_evening(now):
-        print(f"Outside window (evening-only). Local time={now.strftime('%Y-%m-%d %H:%M')}. Exit.")
-        raise SystemExit(0)
 
-    client = login()
+def _reset_run_caches(shared: bool = False) -> None:
+    """Oublie les résultats du run précédent (utile quand plusieurs runs partagent un process).
+    shared=True: ne réinitialise que ce qui est propre au compte; les caches de recherche et de
+    feeds (Candidates déjà analysés) et la query de découverte restent partagés par les comptes
+    d'une même tournée.
+    """
+    if shared:
+        return
+    global _discovery_query
+    _discovery_query = None
+    with _search_cache_lock:
+        _search_cache.clear()
+    with _feed_cache_lock:
+        _feed_cache.clear()
+
+
+def run(
+    client: Optional[Client] = None,
+    state: Optional[Dict[str, Any]] = None,
+    shared_caches: bool = False,
+    stream: bool = False,
+) -> Tuple[Client, Dict[str, Any]]:
+    """Un run complet du pipeline. Client et state sont réutilisés s'ils sont fournis (daemon):
+    ni login ni relecture du state dans ce cas. stream: démarrer le stream Jetstream (daemon).
+    Retourne (client, state) pour le run suivant.
+    """
+    _reset_run_caches(shared=shared_caches)
+    METRICS.reset()
+    SCHEDULER.start()
+    WRITES.clear()  # écritures en file d'un run précédent interrompu
+    try:
+        if client is None:
+            with METRICS.stage("login"):
+                client = login()
+
+        if state is None:
+            with METRICS.stage("load_state"):
+                state = load_state()
+
+        # Un seul state par stream: pas de stream pour une tournée --accounts
+        if stream and not shared_caches:
+            start_stream(client, state)
+        elif STREAM_URL and not shared_caches:
+            print("[stream] BOT2_STREAM_URL is only used with --daemon; using search only")
+
+        with _globals_override(_plan_globals(plan_run(state)) if DAILY_PLAN else {}):
+            _run_stages(client, state)
+    finally:
+        # Exporté même si le run a planté: c'est là qu'on en a le plus besoin
+        if METRICS_DIR:
+            try:
+                METRICS.export(METRICS_DIR)
+            except OSError as e:
+                print(f"[metrics export err] {e}")
+    return client, state
+
+
+def _run_stages(client: Client, state: Dict[str, Any]) -> None:
+    """Les étapes du pipeline, sous les réglages par run en place (plan du jour compris)."""
+    # Fetchs des étapes suivantes: exécutés pendant la première attente entre deux écritures
+    # (la recherche seulement si le pool de candidats est bas), et seulement pour une étape qui
+    # peut tourner avec les réglages de ce run
+    if MAX_REPOSTS_PER_RUN > 0 or (DISCOVERY_WEIGHT > 0 and DISCOVERY_LIKE_LIMIT > 0):
+        SCHEDULER.defer(candidate_pool, client, state, MAX_REPOSTS_PER_RUN)
+    if MAX_REPOSTS_PER_RUN > 0:
+        SCHEDULER.defer(prefetch_author_feeds, client, _repost_feed_limits(), state)
 
     # 1) Engagements opt-in (mentions/réponses)
-    state = load_state()
-    engage_opt_in(client, state)
+    with METRICS.stage("engage_opt_in"):
+        engage_opt_in(client, state)
 
     # 2) Occasionnellement, un post original (reste rare) — liens en commentaire si utilisés
-    maybe_original_post(client)
+    with METRICS.stage("maybe_original_post"):
+        maybe_original_post(client, state)
+        WRITES.flush(client)
 
     # 3) Découverte (likes) selon poids
-    discovery_likes_and_maybe_reposts(client)
+    with METRICS.stage("discovery_likes_and_maybe_reposts"):
+        discovery_likes_and_maybe_reposts(client, state)
+        WRITES.flush(client)
 
     # 4) Reposts (quotes strictement pour QUOTE_HANDLE, sinon repost simple) —
     #    UNIQUEMENT posts originaux avec IMAGES. Liens en commentaire.
-    repost_from_sources_with_quotes(client, state)
+    with METRICS.stage("repost_from_sources_with_quotes"):
+        repost_from_sources_with_quotes(client, state)
+        WRITES.flush(client)
+
+    # Compaction finale: un seul snapshot complet par run
+    with METRICS.stage("save_state"):
+        # Fetchs encore en file: leur étape a été sautée (ou a fetché elle-même), plus rien à préparer
+        SCHEDULER.idle.clear()
+        drain_stream(state)
+        save_state(state)
 
+
+def main(ignore_window: bool = False, accounts: Optional[List[Dict[str, Any]]] = None) -> bool:
+    """Un run (ou une tournée --accounts) si l'heure le permet. False: hors fenêtre, rien fait."""
+    # Garde-fou horaire
+    now = _now_local()
+    if not ignore_window and (_is_quiet(now) or not _is_evening(now)):
+        print(f"Outside window (evening-only). Local time={now.strftime('%Y-%m-%d %H:%M')}. Exit.")
+        return False
+
+    if accounts:
+        run_accounts(accounts)
+    else:
+        run()
     print("Bot2 run completed (evening-only, cooldowns, no duplicates, images-only, links-in-replies).")
+    return True
+
+
+# --- Multi-comptes ---
+# --accounts comptes.json: plusieurs comptes dans un seul process, l'un après l'autre. Chaque
+# compte a son state, son journal, sa session, ses métriques et son token bucket; le pool de
+# connexions HTTP et les caches de recherche/feeds sont communs à la tournée, donc une
+# query ou un feed demandé par deux comptes n'est récupéré qu'une fois.
+#
+# [{"handle": "compte2.bsky.social", "password_env": "BSKY2_APP_PASSWORD",
+#   "state_file": "bot2_state.json", "session_file": "bot2_session.txt",
+#   "source_handles": ["a.bsky.social"], "quote_handle": "loufisart.bsky.social", "repost_limit": 2}]
+#
+# Les mots de passe ne sont jamais dans le fichier: "password_env" nomme la variable qui le porte.
+
+ACCOUNT_SETTINGS = {
+    "quote_handle": "QUOTE_HANDLE",
+    "quote_share": "QUOTE_SHARE",
+    "source_handles": "SOURCE_HANDLES",
+    "queries": "QUERIES_ENV",
+    "max_engagements": "MAX_ENGAGEMENTS_PER_RUN",
+    "repost_limit": "MAX_REPOSTS_PER_RUN",
+    "like_limit": "DISCOVERY_LIKE_LIMIT",
+    "discovery_weight": "DISCOVERY_WEIGHT",
+    "original_post_weight": "DO_ORIGINAL_POST_WEIGHT",
+    "max_posts": "MAX_ORIGINAL_POSTS_PER_RUN",
+    "link_site": "LINK_SITE",
+    "link_opensea": "LINK_OPENSEA",
+    "run_budget_s": "RUN_BUDGET_S",
+    "daily_likes": "DAILY_LIKES",
+    "daily_reposts": "DAILY_REPOSTS",
+    "daily_quotes": "DAILY_QUOTES",
+    "daily_replies": "DAILY_REPLIES",
+    "daily_posts": "DAILY_POSTS",
+}
+_ACCOUNT_FILES = ("handle", "password_env", "state_file", "session_file", "dedup_file")
+
+
+def _account_value(name: str, value: Any) -> Any:
+    if name == "SOURCE_HANDLES":
+        items = value.split(",") if isinstance(value, str) else value
+        return [h.strip() for h in items if h.strip()]
+    if name == "QUERIES_ENV":
+        items = value.split("|") if isinstance(value, str) else value
+        return [q.strip() for q in items if q.strip()]
+    return type(globals()[name])(value)
+
+
+def load_accounts(path: str) -> List[Dict[str, Any]]:
+    """Lit la config multi-comptes; retourne, par compte, les globals à installer pendant son run."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    if not isinstance(raw, list) or not raw:
+        raise SystemExit(f"{path}: liste de comptes attendue.")
+    accounts = []
+    for i, entry in enumerate(raw):
+        handle = (entry.get("handle") or "").strip()
+        password = os.getenv(entry.get("password_env") or "", "")
+        if not handle or not password:
+            raise SystemExit(f"{path}: compte #{i} sans handle ou sans mot de passe (password_env).")
+        state_file = entry.get("state_file") or f"bot2_state.{handle}.json"
+        values: Dict[str, Any] = {
+            "HANDLE": handle,
+            "APP_PASSWORD": password,
+            "STATE_FILE": state_file,
+            "JOURNAL_FILE": os.path.splitext(state_file)[0] + ".journal",
+            "DEDUP_FILE": entry.get("dedup_file") or os.path.splitext(state_file)[0] + ".dedup.bin",
+            "SESSION_FILE": entry.get("session_file") or f"bot2_session.{handle}.txt",
+            "METRICS_DIR": os.path.join(METRICS_DIR, handle) if METRICS_DIR else "",
+            # Comptes enchaînés dans un seul slot: le budget du run est partagé par défaut
+            "RUN_BUDGET_S": RUN_BUDGET_S // len(raw),
+        }
+        for key, value in entry.items():
+            if key in ACCOUNT_SETTINGS:
+                values[ACCOUNT_SETTINGS[key]] = _account_value(ACCOUNT_SETTINGS[key], value)
+            elif key not in _ACCOUNT_FILES:
+                print(f"[accounts] unknown setting '{key}' for @{handle} ignored")
+        accounts.append(values)
+    return accounts
+
+
+@contextmanager
+def _globals_override(values: Dict[str, Any]):
+    g = globals()
+    saved = {k: g[k] for k in values}
+    g.update(values)
+    try:
+        yield
+    finally:
+        g.update(saved)
+
+
+def run_accounts(
+    accounts: List[Dict[str, Any]],
+    sessions: Optional[Dict[str, Tuple[Any, Any, TokenBucket]]] = None,
+) -> Dict[str, Tuple[Any, Any, TokenBucket]]:
+    """Une tournée: un run par compte. sessions ({handle: (client, state, bucket)}) est repris et
+    retourné pour que le daemon garde clients et states d'une tournée à l'autre.
+    """
+    sessions = dict(sessions or {})
+    _reset_run_caches()
+    for values in accounts:
+        handle = values["HANDLE"]
+        client, state, bucket = sessions.get(handle) or (None, None, TokenBucket(WRITES_PER_MIN / 60.0, WRITE_BURST))
+        print(f"=== @{handle} ===")
+        previous_bucket, SCHEDULER.bucket = SCHEDULER.bucket, bucket
+        try:
+            with _globals_override(values):
+                client, state = run(client, state, shared_caches=True)
+        except Exception as e:
+            # Les autres comptes tournent quand même; celui-ci se reconnecte au prochain run
+            print(f"[account err:{handle}] {e}")
+            client, state = None, None
+        finally:
+            SCHEDULER.bucket = previous_bucket
+        sessions[handle] = (client, state, bucket)
+    return sessions
+
+# --- Daemon ---
+# Un seul process pour toute la soirée: import, login et lecture du state une fois, puis
+# DAEMON_RUNS runs répartis dans EVENING_START..EVENING_END (un par tranche égale, instant tiré
+# au hasard dans la tranche). Le state est sauvé à la fin de chaque run (et journalisé à chaque
+# action): un arrêt du process entre deux runs ne perd rien.
+
+def _evening_plan(day: dt.date, runs: int) -> List[dt.datetime]:
+    tz = ZoneInfo(TIMEZONE)
+    start = dt.datetime.combine(day, dt.time(EVENING_START), tz)
+    span = (EVENING_END - EVENING_START) * 3600 / max(1, runs)
+    # 20% de fin de tranche laissés libres: le run a le temps de finir avant la tranche suivante
+    return [start + dt.timedelta(seconds=span * i + random.uniform(0, span * 0.8)) for i in range(runs)]
+
+
+def _sleep_until(when: dt.datetime, tick=None) -> None:
+    # Par tranches: robuste à une mise en veille ou à un changement d'heure. tick() est appelé
+    # après chaque tranche (plus courtes dans ce cas).
+    while True:
+        left = (when - _now_local()).total_seconds()
+        if left <= 0:
+            return
+        time.sleep(min(left, 60 if tick else 300))
+        if tick:
+            tick()
+
+
+def daemon(accounts: Optional[List[Dict[str, Any]]] = None) -> None:
+    runs = max(1, DAEMON_RUNS)
+    client: Optional[Client] = None
+    state: Optional[Dict[str, Any]] = None
+    sessions: Dict[str, Tuple[Any, Any, TokenBucket]] = {}
+    day = _now_local().date()
+    plan = [t for t in _evening_plan(day, runs) if t > _now_local()]
+    print(f"[daemon] {runs} runs per evening ({EVENING_START}:00-{EVENING_END}:00 {TIMEZONE}), budget {RUN_BUDGET_S}s/run")
+    try:
+        while True:
+            if not plan:
+                day += dt.timedelta(days=1)
+                plan = _evening_plan(day, runs)
+            at = plan.pop(0)
+            print(f"[daemon] next run at {at.strftime('%Y-%m-%d %H:%M:%S')}")
+            # Le stream continue entre les runs: son buffer est versé au pool pendant l'attente
+            idle_state = state
+            _sleep_until(at, (lambda: drain_stream(idle_state)) if STREAM and idle_state is not None else None)
+            now = _now_local()
+            if _is_quiet(now) or not _is_evening(now):
+                continue  # réveil tardif (veille): on ne rattrape pas hors fenêtre
+            if accounts:
+                sessions = run_accounts(accounts, sessions)
+                print(f"[daemon] accounts run completed at {_now_local().strftime('%H:%M:%S')}")
+                continue
+            try:
+                client, state = run(client, state, stream=True)
+                print(f"[daemon] run completed at {_now_local().strftime('%H:%M:%S')}")
+            except Exception as e:
+                # Prochain run: nouveau login et state relu depuis le disque (snapshot + journal)
+                print(f"[daemon] run failed: {e}")
+                client, state = None, None
+    except KeyboardInterrupt:
+        print("[daemon] stopped.")
+
+
+def record_run(path: str) -> None:
+    """Run normal (réseau réel) dont toutes les requêtes sont écrites dans la cassette `path`."""
+    global _CASSETTE, _FROZEN_NOW
+    seed = random.SystemRandom().randrange(2 ** 32)
+    # Horloge figée pour tout le run: le replay la fige au même instant (recorded_at)
+    _FROZEN_NOW = dt.datetime.now().astimezone()
+    _CASSETTE = Cassette.record(path, seed, load_state())
+    random.seed(seed)
+    try:
+        ran = main()
+    finally:
+        _CASSETTE.close()
+    if not ran or not _CASSETTE.requests:
+        os.remove(path)
+        raise SystemExit(f"Nothing recorded ({'no request made' if ran else 'outside the evening window'}); "
+                         f"{path} removed.")
+    print(f"Cassette recorded: {path} ({_CASSETTE.requests} requests, seed={seed})")
+
+
+def replay_run(path: str) -> None:
+    """Rejoue une cassette hors-ligne: state initial, seed et config du run enregistré; state,
+    journal, session (et métriques, sauf BOT2_METRICS_DIR explicite) dans un dossier temporaire.
+    """
+    global _CASSETTE, STATE_FILE, JOURNAL_FILE, SESSION_FILE, DEDUP_FILE, METRICS_DIR, HANDLE, APP_PASSWORD
+    global DELAY_MIN_S, DELAY_MAX_S, BACKOFF_BASE_S, _FROZEN_NOW
+    _CASSETTE = Cassette.replay(path)
+    header = _CASSETTE.header
+    # La config est lue à l'import: relancer le process avec les BOT2_* de l'enregistrement
+    env = dict(header.get("env") or {})
+    current = {k: v for k, v in os.environ.items() if k.startswith("BOT2_") and k != "BOT2_METRICS_DIR"}
+    env.pop("BOT2_METRICS_DIR", None)
+    if current != env and not os.environ.get("BOT2_REPLAY_CHILD"):
+        for k in current:
+            del os.environ[k]
+        os.environ.update(env, BOT2_REPLAY_CHILD="1")
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__)] + sys.argv[1:])
+
+    tmp = tempfile.mkdtemp(prefix="bot2-replay-")
+    STATE_FILE = os.path.join(tmp, "bot2_state.json")
+    JOURNAL_FILE = os.path.join(tmp, "bot2_state.journal")
+    SESSION_FILE = os.path.join(tmp, "bot2_session.txt")
+    DEDUP_FILE = os.path.join(tmp, "bot2_dedup.bin")
+    if "BOT2_METRICS_DIR" not in os.environ:
+        METRICS_DIR = tmp
+    with open(STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(header.get("state") or {}, f)
+    if header.get("dedup"):
+        with open(DEDUP_FILE, "wb") as f:
+            f.write(base64.b64decode(header["dedup"]))
+    HANDLE, APP_PASSWORD = header.get("handle") or "replay.invalid", "replay"
+    # Aucune attente réelle; les tirages random.* restent les mêmes (uniform(0, 0) tire quand même)
+    DELAY_MIN_S = DELAY_MAX_S = 0
+    BACKOFF_BASE_S = 0.0
+    SCHEDULER.bucket = TokenBucket(0, WRITE_BURST)
+    # Horloge figée à l'instant de l'enregistrement: mêmes cooldowns, même pool, même plan du jour
+    if header.get("recorded_at"):
+        _FROZEN_NOW = dt.datetime.fromisoformat(header["recorded_at"])
+    random.seed(header["seed"])
+    # Même décision de fenêtre horaire que l'enregistrement: l'horloge est celle de recorded_at
+    try:
+        main()
+    except CassetteMiss as e:
+        raise SystemExit(f"[replay] diverged from {path}: request not in cassette: {e}") from None
+    unplayed = _CASSETTE.unplayed()
+    if unplayed:
+        print(f"[replay] {unplayed} recorded request(s) were not replayed")
+    print(f"Replay of {path} done (seed={header['seed']}); state and metrics in {tmp}")
+
+
+def _cli() -> None:
+    ap = argparse.ArgumentParser(description="Bot Bluesky (compte 2)")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="CASSETTE", help="enregistrer requêtes/réponses du run (JSONL)")
+    mode.add_argument("--replay", metavar="CASSETTE", help="rejouer une cassette sans réseau")
+    ap.add_argument("--daemon", action="store_true", help="rester actif et planifier les runs de la soirée")
+    ap.add_argument("--accounts", metavar="JSON", help="plusieurs comptes dans ce process (voir load_accounts)")
+    args = ap.parse_args()
+    if (args.accounts or args.daemon) and (args.record or args.replay):
+        ap.error("--record/--replay ne se combinent ni avec --accounts ni avec --daemon")
+    accounts = load_accounts(args.accounts) if args.accounts else None
+    if args.daemon:
+        daemon(accounts)
+    elif accounts:
+        main(accounts=accounts)
+    elif args.record:
+        record_run(args.record)
+    elif args.replay:
+        replay_run(args.replay)
+    else:
+        main()
+
+
+if __name__ == "__main__":
+    _cli()